@@ -9,3 +9,4 @@ from .tools.normalize import normalize
 from .tools.describe import describe
 from .tools.cluster import cluster
 from .datageometry import DataGeometry
+from ._shared.cache import cache_stats, clear_cache, set_disk_cache, clear_disk_cache
@@ -5,7 +5,32 @@ from builtins import object
 import os
 
 import numpy as np
-from scipy.linalg import orth
+from numpy.linalg import LinAlgError
+from scipy.linalg import cho_factor, cho_solve
+
+# memory budget (in bytes) for the d x d systems solved at once when filling
+# in missing values
+IMPUTE_BATCH_BYTES = 2**26
+
+# the noise variance is kept above this fraction of the variance of the data,
+# so that it can't underflow (e.g. when d is the number of columns, and the
+# initial loadings reconstruct the observed data exactly)
+MIN_SS_RATIO = 1e-6
+
+
+def _cho_inv(a):
+    """
+    Inverse and log-determinant of a small symmetric positive definite
+    matrix, computed in double precision from its Cholesky factorization
+    (falling back to the pseudo-inverse if it is not positive definite)
+    """
+    a = a.astype(np.float64)
+    try:
+        factor = cho_factor(a)
+    except LinAlgError:
+        return np.linalg.pinv(a), np.linalg.slogdet(a)[1]
+    return cho_solve(factor, np.eye(a.shape[0])), \
+        2 * np.sum(np.log(np.diag(factor[0])))
 
 
 class PPCA(object):
@@ -17,6 +42,9 @@ class PPCA(object):
         self.C = None
         self.means = None
         self.stds = None
+        self.W = None
+        self.ss = None
+        self.valid_series = None
 
     def _standardize(self, X):
 
@@ -25,85 +53,136 @@ class PPCA(object):
 
         return (X - self.means) / self.stds
 
-    def fit(self, data, d=None, tol=1e-4, min_obs=10, verbose=False):
+    def fit(self, data, d=None, tol=1e-4, min_obs=10, verbose=False,
+            max_iter=None, n_fit=None, chunk_size=None, random_state=None):
+        """
+        Fits the model to data (with NaNs for missing values), and fills in
+        the missing values
+
+        d is the rank of the latent space (default: the number of columns).
+        With n_fit, EM only runs on n_fit randomly chosen rows, and the
+        missing values of the other rows are filled in from the fitted model
+        chunk_size rows at a time.  EM stops once the relative changes of its
+        objective and of the noise variance are below tol (after at least 5
+        iterations), or after max_iter iterations.
+        """
 
         self.raw = data
         self.raw[np.isinf(self.raw)] = np.max(self.raw[np.isfinite(self.raw)])
 
         valid_series = np.sum(~np.isnan(self.raw), axis=0) >= min_obs
+        self.valid_series = valid_series
 
-        data = self.raw[:, valid_series].copy()
-        N = data.shape[0]
-        D = data.shape[1]
+        # the N x D arrays are kept in the floating point type of the data
+        # (e.g. float32); the small d x d matrices are inverted in float64
+        dtype = np.result_type(np.float32, self.raw.dtype)
+        data = self.raw[:, valid_series].astype(dtype)
 
         self.means = np.nanmean(data, axis=0)
         self.stds = np.nanstd(data, axis=0)
 
         data = self._standardize(data)
-        observed = ~np.isnan(data)
+
+        # fit on a subsample of the rows
+        rng = np.random if random_state is None else \
+            np.random.RandomState(random_state)
+        if n_fit is not None and n_fit < data.shape[0]:
+            rows = np.zeros(data.shape[0], dtype=bool)
+            rows[rng.choice(data.shape[0], n_fit, replace=False)] = True
+            fit_data = data[rows]
+        else:
+            rows = None
+            fit_data = data
+
+        N = fit_data.shape[0]
+        D = fit_data.shape[1]
+        observed = ~np.isnan(fit_data)
         missing = np.sum(~observed)
-        data[~observed] = 0
+        min_ss = MIN_SS_RATIO * np.nanvar(fit_data)
+        fit_data[~observed] = 0
 
         # initial
 
         if d is None:
-            d = data.shape[1]
+            d = D
 
         if self.C is None:
-            C = np.random.randn(D, d)
+            C = rng.randn(D, d).astype(dtype)
         else:
-            C = self.C
+            C = self.C.astype(dtype)
         CC = np.dot(C.T, C)
-        X = np.dot(np.dot(data, C), np.linalg.inv(CC))
+        X = np.dot(np.dot(fit_data, C), _cho_inv(CC)[0].astype(dtype))
         recon = np.dot(X, C.T)
         recon[~observed] = 0
-        ss = np.sum((recon - data)**2)/(N*D - missing)
+        ss = max(np.sum((recon - fit_data)**2)/(N*D - missing), min_ss)
 
         v0 = np.inf
         counter = 0
 
         while True:
 
-            Sx = np.linalg.inv(np.eye(d) + CC/ss)
+            Sx, logdet = _cho_inv(np.eye(d) + CC/ss)
+            Sx_d = Sx.astype(dtype)
 
             # e-step
             ss0 = ss
             if missing > 0:
                 proj = np.dot(X, C.T)
-                data[~observed] = proj[~observed]
-            X = np.dot(np.dot(data, C), Sx) / ss
+                fit_data[~observed] = proj[~observed]
+            X = np.dot(np.dot(fit_data, C), Sx_d) / ss
 
             # m-step
             XX = np.dot(X.T, X)
-            C = np.dot(np.dot(data.T, X), np.linalg.pinv(XX + N*Sx))
+            C = np.dot(np.dot(fit_data.T, X),
+                       _cho_inv(XX + N*Sx)[0].astype(dtype))
             CC = np.dot(C.T, C)
             recon = np.dot(X, C.T)
             recon[~observed] = 0
-            ss = (np.sum((recon-data)**2) + N*np.sum(CC*Sx) + missing*ss0)/(N*D)
+            ss = max((np.sum((recon-fit_data)**2) + N*np.sum(CC*Sx) +
+                      missing*ss0)/(N*D), min_ss)
 
-            # calc diff for convergence
-            det = np.log(np.linalg.det(Sx))
-            if np.isinf(det):
-                det = abs(np.linalg.slogdet(Sx)[1])
-            v1 = N*(D*np.log(ss) + np.trace(Sx) - det) \
+            # calc diff for convergence (the log-determinant of Sx is minus
+            # that of its inverse)
+            v1 = N*(D*np.log(ss) + np.trace(Sx) + logdet) \
                 + np.trace(XX) - missing*np.log(ss0)
             diff = abs(v1/v0 - 1)
             if verbose:
                 print(diff)
-            if (diff < tol) and (counter > 5):
+
+            # while the noise variance is still moving (e.g. recovering from
+            # a near-zero start, where log(ss) dominates the objective), the
+            # objective can change little relative to its size
+            if (diff < tol) and (counter > 5) and (abs(ss/ss0 - 1) < tol):
                 break
 
             counter += 1
             v0 = v1
+            if max_iter is not None and counter >= max_iter:
+                break
 
+        self.W = C
+        self.ss = ss
 
-        C = orth(C)
-        vals, vecs = np.linalg.eig(np.cov(np.dot(data, C).T))
+        # fill in the missing values (including those of the rows that were
+        # left out of the fit) from the final loadings, so that they match
+        # what impute gives for the same data
+        fit_data[~observed] = np.nan
+        if rows is not None:
+            data[rows] = fit_data
+        else:
+            data = fit_data
+        data = self._impute(data, chunk_size)
+
+        # an orthonormal basis of the loadings (keeping all d columns, even
+        # if EM shrank some of them to zero), rotated onto the principal axes
+        # of the data
+        C = np.linalg.qr(C)[0]
+        vals, vecs = np.linalg.eigh(np.cov(np.dot(data, C).T))
         order = np.flipud(np.argsort(vals))
         vecs = vecs[:, order]
         vals = vals[order]
 
-        C = np.dot(C, vecs)
+        C = np.dot(C, vecs.astype(dtype))
 
         # attach objects to class
         self.C = C
@@ -111,6 +190,52 @@ class PPCA(object):
         self.eig_vals = vals
         self._calc_var()
 
+    def impute(self, data, chunk_size=None):
+        """
+        Fills in the missing values (NaNs) of new data, with the columns of
+        the data the model was fit to, from the fitted loadings (without
+        refitting), chunk_size rows at a time.  Returns the standardized
+        data, like `self.data`, which `transform` projects.
+        """
+        if self.W is None:
+            raise RuntimeError('Fit the data model first.')
+        data = self._standardize(
+            data[:, self.valid_series].astype(self.W.dtype))
+        return self._impute(data, chunk_size)
+
+    def _impute(self, data, chunk_size=None):
+        """
+        Fills in the missing values (NaNs) of standardized data with their
+        conditional means given the observed values of their row, chunk_size
+        rows at a time.  For a row with observed values x_o, the latent
+        position z solves (W_o^T W_o + ss I) z = W_o^T x_o, and the missing
+        values are W_m z.
+        """
+        W = self.W.astype(np.float64)
+        D, d = W.shape
+        batch = max(1, IMPUTE_BATCH_BYTES // (8 * D * d))
+        if chunk_size is None:
+            chunk_size = max(data.shape[0], 1)
+        for start in range(0, data.shape[0], chunk_size):
+            chunk = data[start:start + chunk_size]
+            missing = np.isnan(chunk)
+            incomplete = np.flatnonzero(missing.any(axis=1))
+            for i in range(0, incomplete.shape[0], batch):
+                idx = incomplete[i:i + batch]
+                mask = missing[idx]
+                observed = np.where(mask, 0, chunk[idx]).astype(np.float64)
+                # W_o^T W_o for each row, as W^T W less the missing rows of W
+                missing_w = mask[:, :, np.newaxis] * W
+                lhs = np.dot(W.T, W) + self.ss * np.eye(d) - \
+                    np.matmul(missing_w.transpose(0, 2, 1), W)
+                rhs = np.dot(observed, W)
+                z = np.linalg.solve(lhs, rhs[:, :, np.newaxis])[:, :, 0]
+                filled = np.dot(z, W.T)
+                rows = chunk[idx]
+                rows[mask] = filled[mask]
+                chunk[idx] = rows
+        return data
+
     def transform(self, data=None):
 
         if self.C is None:
@@ -42,6 +42,7 @@ import scipy
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.utils import assert_all_finite
 from sklearn.utils.validation import NotFittedError
+from joblib import Parallel, delayed, effective_n_jobs
 
 __all__ = [
     "SRM", "DetSRM"
@@ -50,7 +51,8 @@ __all__ = [
 logger = logging.getLogger(__name__)
 
 
-def _init_w_transforms(data, features):
+def _init_w_transforms(data, features, init='random', mu=None,
+                       chunk_size=None):
     """Initialize the mappings (Wi) for the SRM with random orthogonal matrices.
 
     Parameters
@@ -62,6 +64,21 @@ def _init_w_transforms(data, features):
     features : int
         The number of features in the model.
 
+    init : str, default: 'random'
+        'random' orthonormalizes a random voxels_i by features matrix per
+        subject. 'sketch' orthonormalizes each subject's response to the
+        same random samples by features matrix, :math:`X_i \\Omega`, so the
+        only random draws are samples by features and the initial mappings
+        already span each subject's leading responses.
+
+    mu : list of array, element i has shape=[voxels_i], optional
+        Voxel means of each subject, when data is not demeaned (only used
+        with chunk_size).
+
+    chunk_size : int or None, default: None
+        If set, the sketch is computed over chunks of chunk_size samples
+        (see `_chunks`).
+
 
     Returns
     -------
@@ -82,20 +99,90 @@ def _init_w_transforms(data, features):
 
         Not thread safe.
     """
+    if init not in ('random', 'sketch'):
+        raise ValueError("Unknown initialization '{0}', expected 'random' "
+                         "or 'sketch'.".format(init))
+
     w = []
     subjects = len(data)
     voxels = np.empty(subjects, dtype=int)
 
-    # Set Wi to a random orthogonal voxels by features matrix
+    if init == 'sketch':
+        sketch = np.random.standard_normal((data[0].shape[1], features))
+
     for subject in range(subjects):
         voxels[subject] = data[subject].shape[0]
-        rnd_matrix = np.random.random((voxels[subject], features))
-        q, r = np.linalg.qr(rnd_matrix)
-        w.append(q)
+        dtype = np.result_type(np.float32, data[subject].dtype)
+        if init == 'sketch':
+            # Set Wi to the orthogonal factor of the subject's sketch
+            y = 0
+            subject_mu = None if mu is None else mu[subject]
+            for chunk, x_chunk in _chunks(data[subject], subject_mu,
+                                          chunk_size):
+                y = y + x_chunk.dot(sketch[chunk].astype(dtype))
+            w.append(_polar(y))
+        else:
+            # Set Wi to a random orthogonal voxels by features matrix
+            rnd_matrix = np.random.random((voxels[subject], features))
+            q, r = np.linalg.qr(rnd_matrix)
+            w.append(q.astype(dtype, copy=False))
 
     return w, voxels
 
 
+def _chunks(x, mu, chunk_size):
+    """Iterate over the demeaned data of a subject in chunks of samples.
+
+    Parameters
+    ----------
+
+    x : 2D array, shape=[voxels, samples]
+        The data of the subject (e.g. a memory-mapped array).
+
+    mu : array, shape=[voxels]
+        The voxel means, subtracted from each chunk.
+
+    chunk_size : int or None
+        The number of samples per chunk. If None, x is already demeaned, and
+        is yielded whole.
+
+
+    Yields
+    ------
+
+    chunk : slice
+        The samples of the chunk.
+
+    x_chunk : 2D array, shape=[voxels, chunk samples]
+        The demeaned data of the chunk.
+    """
+    if chunk_size is None:
+        yield slice(None), x
+        return
+    for start in range(0, x.shape[1], chunk_size):
+        chunk = slice(start, start + chunk_size)
+        yield chunk, x[:, chunk] - mu[:, np.newaxis]
+
+
+def _polar(a, gram=True):
+    """Orthogonal factor :math:`U V^T` of a tall matrix :math:`A = U S V^T`.
+
+    With gram, the factor is computed from the eigendecomposition of the
+    features by features matrix :math:`A^T A = V S^2 V^T`, as
+    :math:`A V S^{-1} V^T`, which only multiplies the voxel-sized matrix
+    instead of decomposing it. This squares the condition number of A, so
+    the SVD is used when A is too ill-conditioned for the precision of its
+    dtype.
+    """
+    if gram:
+        evals, evecs = np.linalg.eigh(a.T.dot(a).astype(np.float64))
+        if evals[0] > np.sqrt(np.finfo(a.dtype).eps) * evals[-1]:
+            return a.dot((evecs / np.sqrt(evals)).dot(evecs.T).astype(
+                a.dtype))
+    u, s, v = np.linalg.svd(a, full_matrices=False)
+    return u.dot(v)
+
+
 class SRM(BaseEstimator, TransformerMixin):
     """Probabilistic Shared Response Model (SRM)
 
@@ -116,6 +203,37 @@ class SRM(BaseEstimator, TransformerMixin):
     rand_seed : int, default: 0
         Seed for initializing the random number generator.
 
+    tol : float or None, default: None
+        Stop early once the log-likelihood changes by less than tol (relative
+        to its previous value) between two evaluations. If None, n_iter
+        iterations are always run.
+
+    likelihood_every : int or None, default: 1
+        Evaluate the log-likelihood every likelihood_every iterations, when
+        it is needed for tol or logged. 0 or None never evaluates it (and
+        disables tol).
+
+    n_jobs : int, default: 1
+        Number of threads used to update the subjects' transforms in the
+        M-step. -1 uses all CPUs.
+
+    init : str, default: 'random'
+        'random' initializes the transforms with random orthogonal matrices
+        and updates them with SVDs of the voxels by features cross products.
+        'sketch' initializes them from a random sketch of each subject's data
+        (a samples by features random matrix shared by all subjects) and
+        updates them through the features by features Gram matrices of the
+        cross products, which avoids drawing and decomposing voxel-sized
+        matrices on data with many voxels.
+
+    chunk_size : int or None, default: None
+        If set, the data is never copied or demeaned as a whole: the
+        statistics of each iteration (the subjects' cross products with the
+        shared response) are accumulated over chunks of chunk_size samples.
+        The subjects can then be memory-mapped arrays (e.g. from
+        ``np.load(path, mmap_mode='r')``) larger than the memory, which are
+        read twice per iteration.
+
 
     Attributes
     ----------
@@ -126,6 +244,12 @@ class SRM(BaseEstimator, TransformerMixin):
     s_ : array, shape=[features, samples]
         The shared response.
 
+    n_iter_ : int
+        The number of iterations run.
+
+    loglikelihood_ : float or None
+        The last log-likelihood evaluated, if any.
+
     sigma_s_ : array, shape=[features, features]
         The covariance of the shared response Normal distribution.
 
@@ -154,10 +278,17 @@ class SRM(BaseEstimator, TransformerMixin):
        K - the number of features (typically, :math:`V \\gg T \\gg K`).
     """
 
-    def __init__(self, n_iter=10, features=50, rand_seed=0):
+    def __init__(self, n_iter=10, features=50, rand_seed=0, tol=None,
+                 likelihood_every=1, n_jobs=1, init='random',
+                 chunk_size=None):
         self.n_iter = n_iter
         self.features = features
         self.rand_seed = rand_seed
+        self.tol = tol
+        self.likelihood_every = likelihood_every
+        self.n_jobs = n_jobs
+        self.init = init
+        self.chunk_size = chunk_size
         return
 
     def fit(self, X, y=None):
@@ -187,7 +318,12 @@ class SRM(BaseEstimator, TransformerMixin):
         number_trs = X[0].shape[1]
         number_subjects = len(X)
         for subject in range(number_subjects):
-            assert_all_finite(X[subject])
+            if self.chunk_size is None:
+                assert_all_finite(X[subject])
+            else:
+                for start in range(0, X[subject].shape[1], self.chunk_size):
+                    assert_all_finite(
+                        X[subject][:, start:start + self.chunk_size])
             if X[subject].shape[1] != number_trs:
                 raise ValueError("Different number of samples between subjects"
                                  ".")
@@ -245,7 +381,8 @@ class SRM(BaseEstimator, TransformerMixin):
         Returns
         -------
         x : list of array, element i has shape=[voxels_i, samples]
-            Demeaned data for each subject.
+            Demeaned data for each subject (with chunk_size, the data
+            itself, which `_chunks` demeans one chunk at a time).
 
         mu : list of array, element i has shape=[voxels_i]
             Voxel means over samples, per subject.
@@ -262,10 +399,24 @@ class SRM(BaseEstimator, TransformerMixin):
 
         trace_xtx = np.zeros(subjects)
         for subject in range(subjects):
-            mu.append(np.mean(data[subject], 1))
             rho2[subject] = 1
-            trace_xtx[subject] = np.sum(data[subject] ** 2)
-            x.append(data[subject] - mu[subject][:, np.newaxis])
+            if self.chunk_size is None:
+                mu.append(np.mean(data[subject], 1))
+                trace_xtx[subject] = np.sum(np.square(data[subject],
+                                                      dtype=np.float64))
+                x.append(data[subject] - mu[subject][:, np.newaxis])
+                continue
+
+            samples = data[subject].shape[1]
+            total = np.zeros(data[subject].shape[0])
+            for start in range(0, samples, self.chunk_size):
+                chunk = data[subject][:, start:start + self.chunk_size]
+                total += np.sum(chunk, 1, dtype=np.float64)
+                trace_xtx[subject] += np.sum(np.square(chunk,
+                                                       dtype=np.float64))
+            mu.append((total / samples).astype(
+                np.result_type(np.float32, data[subject].dtype)))
+            x.append(data[subject])
 
         return x, mu, rho2, trace_xtx
 
@@ -349,16 +500,27 @@ class SRM(BaseEstimator, TransformerMixin):
         samples = data[0].shape[1]
         subjects = len(data)
 
+        # the per-sample arrays are kept in the floating point type of the
+        # data (e.g. float32); the features x features matrices use float64
+        dtype = np.result_type(np.float32, *[d.dtype for d in data])
+
         np.random.seed(self.rand_seed)
 
         # Initialization step: initialize the outputs with initial values,
         # voxels with the number of voxels in each subject, and trace_xtx with
         # the ||X_i||_F^2 of each subject.
-        w, voxels = _init_w_transforms(data, self.features)
         x, mu, rho2, trace_xtx = self._init_structures(data, subjects)
-        shared_response = np.zeros((self.features, samples))
+        w, voxels = _init_w_transforms(x, self.features, self.init, mu,
+                                       self.chunk_size)
+        gram = self.init == 'sketch'
+        shared_response = np.zeros((self.features, samples), dtype=dtype)
         sigma_s = np.identity(self.features)
 
+        n_jobs = min(effective_n_jobs(self.n_jobs), subjects)
+        loglike = None
+        self.loglikelihood_ = None
+        self.n_iter_ = 0
+
         # Main loop of the algorithm (run
         for iteration in range(self.n_iter):
             logger.info('Iteration %d' % (iteration + 1))
@@ -385,18 +547,21 @@ class SRM(BaseEstimator, TransformerMixin):
 
             # Compute the sum of W_i^T * rho_i^-2 * X_i, and the sum of traces
             # of X_i^T * rho_i^-2 * X_i
-            wt_invpsi_x = np.zeros((self.features, samples))
+            wt_invpsi_x = np.zeros((self.features, samples), dtype=dtype)
             trace_xt_invsigma2_x = 0.0
             for subject in range(subjects):
-                wt_invpsi_x += (w[subject].T.dot(x[subject])) / rho2[subject]
+                for chunk, x_chunk in _chunks(x[subject], mu[subject],
+                                              self.chunk_size):
+                    wt_invpsi_x[:, chunk] += (w[subject].T.dot(x_chunk)
+                                              / rho2[subject])
                 trace_xt_invsigma2_x += trace_xtx[subject] / rho2[subject]
 
             log_det_psi = np.sum(np.log(rho2) * voxels)
 
             # Update the shared response
             shared_response = sigma_s.dot(
-                np.identity(self.features) - rho0 * inv_sigma_s_rhos).dot(
-                    wt_invpsi_x)
+                np.identity(self.features) - rho0 * inv_sigma_s_rhos).astype(
+                    dtype).dot(wt_invpsi_x)
 
             # M-step
 
@@ -407,29 +572,104 @@ class SRM(BaseEstimator, TransformerMixin):
 
             # Update each subject's mapping transform W_i and error variance
             # rho_i^2
-            for subject in range(subjects):
-                a_subject = x[subject].dot(shared_response.T)
-                perturbation = np.zeros(a_subject.shape)
-                np.fill_diagonal(perturbation, 0.001)
-                u_subject, s_subject, v_subject = np.linalg.svd(
-                    a_subject + perturbation, full_matrices=False)
-                w[subject] = u_subject.dot(v_subject)
-                rho2[subject] = trace_xtx[subject]
-                rho2[subject] += -2 * np.sum(w[subject] * a_subject).sum()
-                rho2[subject] += trace_sigma_s
-                rho2[subject] /= samples * voxels[subject]
-
-            if logger.isEnabledFor(logging.INFO):
+            # (numpy releases the GIL in the products and SVDs, so threads
+            # share the data without copying it)
+            if n_jobs > 1:
+                updates = Parallel(n_jobs=n_jobs, prefer='threads')(
+                    delayed(_update_subject)(x[subject], shared_response,
+                                             trace_xtx[subject], trace_sigma_s,
+                                             gram, mu[subject],
+                                             self.chunk_size)
+                    for subject in range(subjects))
+            else:
+                updates = [_update_subject(x[subject], shared_response,
+                                           trace_xtx[subject], trace_sigma_s,
+                                           gram, mu[subject], self.chunk_size)
+                           for subject in range(subjects)]
+            for subject, (w_subject, rho2_subject) in enumerate(updates):
+                w[subject] = w_subject
+                rho2[subject] = rho2_subject / (samples * voxels[subject])
+            self.n_iter_ = iteration + 1
+
+            if self._evaluate_likelihood(iteration):
                 # Calculate and log the current log-likelihood for checking
                 # convergence
+                previous = loglike
                 loglike = self._likelihood(
                     chol_sigma_s_rhos, log_det_psi, chol_sigma_s,
                     trace_xt_invsigma2_x, inv_sigma_s_rhos, wt_invpsi_x,
                     samples)
+                self.loglikelihood_ = loglike
                 logger.info('Objective function %f' % loglike)
 
+                if self.tol is not None and previous is not None and \
+                        abs(loglike - previous) <= self.tol * abs(previous):
+                    logger.info('Converged after %d iterations'
+                                % (iteration + 1))
+                    break
+
         return sigma_s, w, mu, rho2, shared_response
 
+    def _evaluate_likelihood(self, iteration):
+        """Whether to evaluate the log-likelihood at this iteration"""
+        if not self.likelihood_every:
+            return False
+        if self.tol is None and not logger.isEnabledFor(logging.INFO):
+            return False
+        return (iteration + 1) % self.likelihood_every == 0
+
+
+def _update_subject(x, shared_response, trace_xtx, trace_sigma_s,
+                    gram=False, mu=None, chunk_size=None):
+    """Update the mapping transform W_i and the error variance rho_i^2 of one
+    subject (the M-step of the probabilistic SRM).
+
+    Parameters
+    ----------
+
+    x : array, shape=[voxels_i, samples]
+        Demeaned data of the subject (with chunk_size, the data itself).
+
+    shared_response : array, shape=[features, samples]
+        The current shared response.
+
+    trace_xtx : float
+        The squared Frobenius norm of x.
+
+    trace_sigma_s : float
+        The number of samples times the trace of the current Sigma_s.
+
+    gram : bool, default: False
+        Compute the transform through the features by features Gram matrix
+        instead of an SVD (see `_polar`).
+
+    mu : array, shape=[voxels_i], optional
+        Voxel means of the subject, when x is not demeaned (only used with
+        chunk_size).
+
+    chunk_size : int or None, default: None
+        If set, the cross product of x with the shared response is
+        accumulated over chunks of chunk_size samples (see `_chunks`).
+
+
+    Returns
+    -------
+
+    w : array, shape=[voxels_i, features]
+        The updated orthogonal transform.
+
+    rho2 : float
+        The updated error variance, times samples * voxels_i.
+    """
+    a_subject = 0
+    for chunk, x_chunk in _chunks(x, mu, chunk_size):
+        a_subject = a_subject + x_chunk.dot(shared_response[:, chunk].T)
+    perturbation = np.zeros(a_subject.shape, dtype=a_subject.dtype)
+    np.fill_diagonal(perturbation, 0.001)
+    w = _polar(a_subject + perturbation, gram)
+    rho2 = trace_xtx - 2 * np.sum(w * a_subject) + trace_sigma_s
+    return w, rho2
+
 
 class DetSRM(BaseEstimator, TransformerMixin):
     """Deterministic Shared Response Model (DetSRM)
@@ -0,0 +1,590 @@
+#!/usr/bin/env python
+
+"""
+Caching helpers
+"""
+
+##PACKAGES##
+from __future__ import division
+import os
+import sys
+import json
+import pickle
+import shutil
+import inspect
+import hashlib
+import functools
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import six
+from ..config import __version__
+
+# default memory budget (in bytes) for the cache of each memoized function
+DEFAULT_MAXBYTES = 2**30
+
+# default size cap (in bytes) for the on-disk result cache
+DEFAULT_DISK_MAXBYTES = 10 * 2**30
+
+##HASHING##
+class UndigestableError(TypeError):
+    """Raised when an object cannot be identified by its contents"""
+
+def _update_digest(h, obj):
+    """
+    Feeds a description of obj into the hash object h
+
+    Arrays are described by their dtype, shape and raw bytes, so two arrays
+    only share a digest if their contents are identical.  Containers are
+    walked recursively and scalars, strings and types are described by their
+    repr.  Anything else (e.g. functions, generators or model instances) has
+    no description of its contents, and raises an UndigestableError.
+    """
+    if _is_readonly_memmap(obj):
+        # read-only maps are identified by their file and position, so large
+        # files don't need to be read to be hashed
+        stat = os.stat(obj.filename)
+        pos = obj.ctypes.data - np.frombuffer(obj._mmap, dtype=np.uint8).ctypes.data
+        h.update(b'memmap')
+        h.update(str((obj.filename, stat.st_size, stat.st_mtime, obj.offset, pos,
+                      obj.dtype.str, obj.shape, obj.strides)).encode('utf-8'))
+    elif isinstance(obj, np.ndarray):
+        h.update(b'ndarray')
+        h.update(str((obj.dtype.str, obj.shape)).encode('utf-8'))
+        if obj.dtype.hasobject:
+            for item in obj.ravel():
+                _update_digest(h, item)
+        else:
+            h.update(np.ascontiguousarray(obj).view(np.uint8))
+    elif sp.issparse(obj):
+        h.update(str(('sparse', obj.format, obj.shape)).encode('utf-8'))
+        if obj.format not in ('csr', 'csc', 'bsr', 'coo'):
+            obj = obj.tocsr()
+        for attr in ('data', 'indices', 'indptr', 'row', 'col'):
+            if hasattr(obj, attr):
+                _update_digest(h, getattr(obj, attr))
+    elif isinstance(obj, pd.DataFrame):
+        h.update(b'dataframe')
+        h.update(repr(list(obj.columns)).encode('utf-8'))
+        _update_digest(h, pd.util.hash_pandas_object(obj, index=True).values)
+    elif isinstance(obj, pd.Series):
+        h.update(b'series')
+        h.update(repr(obj.name).encode('utf-8'))
+        _update_digest(h, pd.util.hash_pandas_object(obj, index=True).values)
+    elif isinstance(obj, (list, tuple)):
+        h.update(str((type(obj).__name__, len(obj))).encode('utf-8'))
+        for item in obj:
+            _update_digest(h, item)
+    elif isinstance(obj, dict):
+        h.update(str(('dict', len(obj))).encode('utf-8'))
+        for key in sorted(obj, key=repr):
+            _update_digest(h, key)
+            _update_digest(h, obj[key])
+    elif isinstance(obj, six.binary_type):
+        h.update(b'bytes')
+        h.update(obj)
+    elif obj is None or isinstance(obj, (bool, int, float, complex, np.generic,
+                                         six.string_types, six.text_type,
+                                         type, np.dtype)):
+        h.update(type(obj).__name__.encode('utf-8'))
+        h.update(repr(obj).encode('utf-8'))
+    else:
+        # the repr of other objects may not reflect their state, and often
+        # embeds a memory address that is reused once the object is freed
+        raise UndigestableError('Cannot digest the contents of a %s'
+                                % type(obj).__name__)
+
+def _is_readonly_memmap(obj):
+    return isinstance(obj, np.memmap) and obj.mode == 'r' and \
+        getattr(obj, '_mmap', None) is not None and bool(obj.filename)
+
+def digest(*objs):
+    """
+    Returns a hex digest of the contents of the passed objects
+
+    Parameters
+    ----------
+    objs : any
+        Numpy arrays, scipy.sparse matrices, dataframes, scalars, strings,
+        types and (nested) lists, tuples and dicts of these
+
+    Returns
+    ----------
+    digest : str
+        A hex digest identifying the contents of objs
+
+    Raises
+    ----------
+    UndigestableError
+        If objs contain any other object (e.g. a function or model instance)
+
+    """
+    h = hashlib.sha1()
+    _update_digest(h, objs)
+    return h.hexdigest()
+
+def persistable(obj):
+    """
+    Checks whether the digest of obj is stable across interpreter sessions
+
+    Only data, scalars and strings (and containers of these) qualify.  Calls
+    involving anything else (e.g. types or class instances) are never
+    persisted to disk.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, complex, np.generic,
+                                       six.string_types, six.binary_type,
+                                       six.text_type, pd.DataFrame)) or \
+            sp.issparse(obj):
+        return True
+    elif isinstance(obj, np.ndarray):
+        return (not obj.dtype.hasobject) or all(persistable(i) for i in obj.ravel())
+    elif isinstance(obj, (list, tuple)):
+        return all(persistable(i) for i in obj)
+    elif isinstance(obj, dict):
+        return all(persistable(k) and persistable(v) for k, v in obj.items())
+    else:
+        return False
+
+def bind_args(func, args, kwargs):
+    """
+    Maps the arguments of a call onto the parameter names of func
+
+    Defaults are filled in, so `f(x, 3)` and `f(x, ndims=3)` bind to the same
+    parameters.
+    """
+    if hasattr(inspect, 'signature'):
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        params = bound.arguments
+    else:
+        params = inspect.getcallargs(func, *args, **kwargs)
+    return sorted(params.items())
+
+def nbytes(obj):
+    """Estimates the memory (in bytes) held by obj"""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    elif sp.issparse(obj):
+        return sum(getattr(obj, attr).nbytes for attr in
+                   ('data', 'indices', 'indptr', 'row', 'col')
+                   if hasattr(obj, attr))
+    elif isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True).sum())
+    elif isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(nbytes(i) for i in obj)
+    elif isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(nbytes(i) for i in obj.values())
+    else:
+        return sys.getsizeof(obj)
+
+##CACHES##
+class LRUCache(object):
+    """
+    A dictionary-like cache that evicts its least recently used entries once
+    the values it holds exceed a byte budget
+
+    Parameters
+    ----------
+    maxbytes : int or None
+        Memory budget for the cached values.  If None, entries are never
+        evicted (default: 1GB).
+
+    """
+
+    def __init__(self, maxbytes=DEFAULT_MAXBYTES):
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, key):
+        # re-insert the entry to mark it as most recently used
+        value = self._data.pop(key)
+        self._data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._data:
+            self.pop(key)
+        size = nbytes(value)
+        if self.maxbytes is not None and size > self.maxbytes:
+            return
+        self._data[key] = value
+        self._sizes[key] = size
+        self.nbytes += size
+        self._evict()
+
+    def pop(self, key):
+        self.nbytes -= self._sizes.pop(key)
+        return self._data.pop(key)
+
+    def clear(self):
+        self._data.clear()
+        self._sizes.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Returns a dict of entries, hits, misses, evictions and bytes held"""
+        return {
+            'entries' : len(self._data),
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'evictions' : self.evictions,
+            'nbytes' : self.nbytes,
+            'maxbytes' : self.maxbytes
+        }
+
+    def _evict(self):
+        if self.maxbytes is None:
+            return
+        while self.nbytes > self.maxbytes and self._data:
+            self.pop(next(iter(self._data)))
+            self.evictions += 1
+
+# caches of all memoized functions, by function name
+_caches = OrderedDict()
+
+def named_cache(name, maxbytes=DEFAULT_MAXBYTES):
+    """
+    Creates an LRUCache that is reported by `cache_stats` and emptied by
+    `clear_cache` under the given name
+    """
+    cache = _caches[name] = LRUCache(maxbytes=maxbytes)
+    return cache
+
+def memoize(obj=None, maxbytes=DEFAULT_MAXBYTES, skip=None):
+    """
+    Caches the results of a function in a bounded LRU cache
+
+    Arguments are keyed by a digest of their contents (see `digest`), so
+    passing a numpy array costs a single pass over its bytes.  Calls with
+    arguments that cannot be digested (e.g. functions or model instances) are
+    not cached, and neither are calls where the argument named by `skip`
+    (e.g. an `inplace` flag) is true.  The cache is attached to the decorated
+    function as `func.cache`; its budget can be changed at any time through
+    `func.cache.maxbytes`.
+
+    Can be used bare (`@memoize`) or with arguments (`@memoize(maxbytes=...)`).
+    """
+    if obj is None:
+        return functools.partial(memoize, maxbytes=maxbytes, skip=skip)
+
+    cache = obj.cache = named_cache(obj.__name__, maxbytes=maxbytes)
+
+    @functools.wraps(obj)
+    def memoizer(*args, **kwargs):
+        params = bind_args(obj, args, kwargs)
+        if skip is not None and dict(params).get(skip):
+            return obj(*args, **kwargs)
+        try:
+            key = digest(params)
+        except UndigestableError:
+            return obj(*args, **kwargs)
+        if key in cache:
+            cache.hits += 1
+            return cache[key]
+        cache.misses += 1
+        result = obj(*args, **kwargs)
+        cache[key] = result
+        return result
+    return memoizer
+
+def cache_stats():
+    """
+    Reports the state of the in-memory cache of each memoized function
+
+    Returns
+    ----------
+    stats : dict
+        A dictionary keyed by function name (e.g. 'reduce', 'align',
+        'normalize', 'cluster', 'text2mat').  Each value is a dictionary with
+        the number of cached 'entries', cache 'hits' and 'misses', the number
+        of 'evictions', the bytes held by the cached results ('nbytes') and
+        the cache budget ('maxbytes').
+
+    """
+    return OrderedDict((name, cache.stats()) for name, cache in _caches.items())
+
+def clear_cache(func=None):
+    """
+    Empties the in-memory cache of memoized functions and resets its counters
+
+    Parameters
+    ----------
+    func : function, str or None
+        If passed, only the cache of this function (e.g. `hypertools.reduce`
+        or 'reduce') is cleared.  Otherwise, all caches are cleared
+        (default: None).
+
+    """
+    if func is None:
+        caches = list(_caches.values())
+    elif isinstance(func, six.string_types):
+        caches = [_caches[func]]
+    else:
+        caches = [func.cache]
+    for cache in caches:
+        cache.clear()
+
+class DiskCache(object):
+    """
+    A size-capped store of array results on disk
+
+    Each entry is a directory of `.npy` files (one per array in the result)
+    that is memory-mapped when read back, so large results are paged in on
+    demand rather than loaded up front.  The arrays are returned as plain
+    (copy-on-write) numpy arrays in the container type of the stored result,
+    so a cached result is handled exactly like a freshly computed one.
+    Results that come with their fitted model (the `(data, model)` tuples
+    returned with return_model=True) also store the model, pickled.  When
+    the cache grows beyond `maxbytes`, the least recently used entries are
+    removed.
+
+    Parameters
+    ----------
+    path : str
+        Directory to store the cache in.  Created if it does not exist.
+
+    maxbytes : int or None
+        Size cap for the cache (default: 10GB).  If None, entries are never
+        evicted.
+
+    """
+
+    def __init__(self, path, maxbytes=DEFAULT_DISK_MAXBYTES):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.maxbytes = maxbytes
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def _entry(self, name, key):
+        return os.path.join(self.path, name, key)
+
+    def get(self, name, key):
+        """Returns the cached result, or None if there is no entry"""
+        entry = self._entry(name, key)
+        index = os.path.join(entry, 'index.json')
+        try:
+            with open(index) as f:
+                meta = json.load(f)
+            arrs = [np.load(os.path.join(entry, '%d.npy' % i), mmap_mode='c',
+                            allow_pickle=False) for i in range(meta['n'])]
+            if meta.get('model'):
+                with open(os.path.join(entry, 'model.pkl'), 'rb') as f:
+                    model = pickle.load(f)
+        except (IOError, OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # mark the entry as recently used
+        os.utime(index, None)
+
+        # drop the np.memmap subclass (the data stays paged in on demand), so
+        # the result isn't mistaken for memory-mapped input downstream
+        arrs = [a.view(np.ndarray) for a in arrs]
+        if meta['kind'] == 'array':
+            value = arrs[0]
+        elif meta['kind'] == 'formatted':
+            from ..tools.format_data import FormattedData
+            value = FormattedData(arrs, missing=meta.get('missing'))
+        else:
+            value = arrs
+        if meta.get('model'):
+            return value, model
+        return value
+
+    def set(self, name, key, value):
+        """
+        Stores an array or list of arrays, optionally paired with a fitted
+        model as a `(data, model)` tuple.  Other results are skipped.
+        """
+        from ..tools.format_data import FormattedData
+        meta = {}
+        if isinstance(value, tuple) and len(value) == 2:
+            value, model = value
+            try:
+                model = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError, ValueError):
+                return
+            meta['model'] = True
+        if isinstance(value, np.ndarray):
+            kind, arrs = 'array', [value]
+        elif isinstance(value, list) and len(value) > 0 and \
+                all(isinstance(i, np.ndarray) for i in value):
+            kind, arrs = 'list', value
+            if isinstance(value, FormattedData):
+                kind = 'formatted'
+                meta['missing'] = value.missing
+            elif type(value) is not list:
+                return
+        else:
+            return
+        if any(a.dtype.hasobject for a in arrs):
+            return
+
+        # write to a temporary directory first so readers never see a
+        # partially written entry
+        entry = self._entry(name, key)
+        tmp = os.path.join(self.path, name, '.%s-%d' % (key, os.getpid()))
+        if not os.path.isdir(tmp):
+            os.makedirs(tmp)
+        for i, arr in enumerate(arrs):
+            np.save(os.path.join(tmp, '%d.npy' % i), np.asarray(arr))
+        if meta.get('model'):
+            with open(os.path.join(tmp, 'model.pkl'), 'wb') as f:
+                f.write(model)
+        with open(os.path.join(tmp, 'index.json'), 'w') as f:
+            meta.update({'kind' : kind, 'n' : len(arrs)})
+            json.dump(meta, f)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict()
+
+    def entries(self):
+        """Returns a list of (last used, size, path) for each entry"""
+        entries = []
+        for name in os.listdir(self.path):
+            if not os.path.isdir(os.path.join(self.path, name)):
+                continue
+            for key in os.listdir(os.path.join(self.path, name)):
+                entry = self._entry(name, key)
+                index = os.path.join(entry, 'index.json')
+                if key.startswith('.') or not os.path.isfile(index):
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry, f))
+                           for f in os.listdir(entry))
+                entries.append((os.path.getmtime(index), size, entry))
+        return entries
+
+    @property
+    def nbytes(self):
+        return sum(e[1] for e in self.entries())
+
+    def _evict(self):
+        if self.maxbytes is None:
+            return
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+        while total > self.maxbytes and entries:
+            _, size, entry = entries.pop(0)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def invalidate(self, name=None, key=None):
+        """Removes one entry, all entries of a function, or everything"""
+        if name is None:
+            targets = [os.path.join(self.path, n) for n in os.listdir(self.path)]
+        elif key is None:
+            targets = [os.path.join(self.path, name)]
+        else:
+            targets = [self._entry(name, key)]
+        for target in targets:
+            if os.path.isdir(target):
+                shutil.rmtree(target, ignore_errors=True)
+
+# the active disk cache (None when disabled)
+_disk_cache = None
+
+def set_disk_cache(path=None, maxbytes=DEFAULT_DISK_MAXBYTES):
+    """
+    Enables (or disables) the on-disk result cache
+
+    When enabled, the results of `analyze`, `reduce`, `align` and `text2mat`
+    are stored on disk, keyed by a digest of the input data and parameters.
+    Calling the same function on the same data in a later session returns the
+    stored (memory-mapped) result instead of refitting the model.  Calls
+    that pass objects which cannot be reliably identified across sessions
+    (e.g. model instances or DataGeometry objects) are not cached.  Fitted
+    models returned along with the results (return_model=True) are stored
+    with pickle, so only point the cache at a directory you trust.  The cache
+    can also be enabled by setting the HYPERTOOLS_CACHE_DIR environment
+    variable before importing hypertools.
+
+    Parameters
+    ----------
+    path : str or None
+        Directory to store cached results in.  If None, the disk cache is
+        disabled (default: None).
+
+    maxbytes : int or None
+        Size cap for the cache.  Least recently used results are removed once
+        the cap is exceeded (default: 10GB).  If None, the cache is unbounded.
+
+    """
+    global _disk_cache
+    if path is None:
+        _disk_cache = None
+    else:
+        _disk_cache = DiskCache(path, maxbytes=maxbytes)
+
+def clear_disk_cache(func=None):
+    """
+    Removes results from the on-disk result cache
+
+    Parameters
+    ----------
+    func : function, str or None
+        If passed, only the results of this function (e.g. `hypertools.reduce`
+        or 'reduce') are removed.  Otherwise, the whole cache is cleared
+        (default: None).
+
+    """
+    if _disk_cache is None:
+        return
+    if func is not None and not isinstance(func, six.string_types):
+        func = func.__name__
+    _disk_cache.invalidate(func)
+
+def persist(obj):
+    """
+    Stores the results of a function in the on-disk cache, if one is enabled
+
+    Results are keyed by the hypertools version as well as the arguments, so
+    results stored by another version are never returned.  The decorated
+    function gains an `invalidate` method that removes the stored result for
+    a given set of arguments.
+    """
+    name = obj.__name__
+
+    def make_key(args, kwargs):
+        params = bind_args(obj, args, kwargs)
+        if not persistable(params):
+            return None
+        return digest(name, __version__, params)
+
+    @functools.wraps(obj)
+    def persister(*args, **kwargs):
+        cache = _disk_cache
+        key = None if cache is None else make_key(args, kwargs)
+        if key is None:
+            return obj(*args, **kwargs)
+        result = cache.get(name, key)
+        if result is None:
+            result = obj(*args, **kwargs)
+            cache.set(name, key, result)
+        return result
+
+    def invalidate(*args, **kwargs):
+        key = make_key(args, kwargs)
+        if _disk_cache is not None and key is not None:
+            _disk_cache.invalidate(name, key)
+    persister.invalidate = invalidate
+    return persister
+
+if os.environ.get('HYPERTOOLS_CACHE_DIR'):
+    set_disk_cache(os.environ['HYPERTOOLS_CACHE_DIR'])
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+
+"""
+Scikit-learn compatible models used by the reduce tool
+"""
+
+##PACKAGES##
+from __future__ import division
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin, clone
+from sklearn.neighbors import NearestNeighbors
+from sklearn.utils import check_array, check_random_state
+from sklearn.utils.extmath import randomized_svd
+
+class RandomizedPCA(BaseEstimator, TransformerMixin):
+    """
+    Principal component analysis using a randomized truncated SVD
+
+    The leading components are found from a random sketch of the (centered)
+    data refined with a few power iterations (Halko et al., 2011), which is
+    much faster than a full SVD when n_components is much smaller than the
+    number of samples and features.
+
+    Halko N, Martinsson PG, and Tropp JA (2011) Finding structure with
+    randomness: Probabilistic algorithms for constructing approximate matrix
+    decompositions. SIAM Review 53, 217 -- 288.
+
+    Parameters
+    ----------
+    n_components : int
+        Number of components to keep
+
+    n_oversamples : int
+        Number of extra random vectors used to sketch the range of the data.
+        More oversampling gives a more accurate result (default: 10).
+
+    n_iter : int
+        Number of power iterations.  More iterations give a more accurate
+        result when the spectrum decays slowly (default: 4).
+
+    whiten : bool
+        Scale the components to unit variance (default: False)
+
+    random_state : int, RandomState instance or None
+        Seed for the random sketch (default: 0)
+
+    Attributes
+    ----------
+    components_ : array, shape (n_components, n_features)
+        Principal axes in feature space
+
+    mean_ : array, shape (n_features,)
+        Per-feature mean of the training data
+
+    explained_variance_ : array, shape (n_components,)
+        Variance explained by each component
+
+    explained_variance_ratio_ : array, shape (n_components,)
+        Fraction of the total variance explained by each component
+
+    approximation_error_ : float
+        Frobenius norm of the residual of the rank n_components approximation
+        of the centered data, relative to the norm of the centered data
+
+    """
+
+    def __init__(self, n_components=None, n_oversamples=10, n_iter=4,
+                 whiten=False, random_state=0):
+        self.n_components = n_components
+        self.n_oversamples = n_oversamples
+        self.n_iter = n_iter
+        self.whiten = whiten
+        self.random_state = random_state
+
+    def fit(self, X, y=None):
+        self._fit(X)
+        return self
+
+    def fit_transform(self, X, y=None):
+        U, S = self._fit(X)
+        if self.whiten:
+            return U * np.sqrt(X.shape[0] - 1)
+        return U * S
+
+    def transform(self, X):
+        X = check_array(X, dtype=[np.float64, np.float32])
+        X_transformed = np.dot(X - self.mean_, self.components_.T)
+        if self.whiten:
+            X_transformed /= np.sqrt(self.explained_variance_)
+        return X_transformed
+
+    def _fit(self, X):
+        X = check_array(X, dtype=[np.float64, np.float32])
+        n_samples, n_features = X.shape
+        n_components = self.n_components
+        if n_components is None:
+            n_components = min(n_samples, n_features)
+
+        self.mean_ = np.mean(X, axis=0)
+        X = X - self.mean_
+        U, S, V = randomized_svd(X, n_components,
+                                 n_oversamples=self.n_oversamples,
+                                 n_iter=self.n_iter,
+                                 random_state=self.random_state)
+
+        total_ss = np.vdot(X, X)
+        self.n_components_ = n_components
+        self.components_ = V
+        self.singular_values_ = S
+        self.explained_variance_ = S ** 2 / max(n_samples - 1, 1)
+        self.explained_variance_ratio_ = S ** 2 / total_ss
+        self.approximation_error_ = np.sqrt(max(0., 1 - np.sum(S ** 2) / total_ss))
+        return U, S
+
+class LandmarkEmbedding(BaseEstimator, TransformerMixin):
+    """
+    Fits a model on a random subsample of landmark rows, then places every
+    row by out-of-sample extension
+
+    Manifold learners such as TSNE, MDS, Isomap and SpectralEmbedding scale
+    quadratically (or worse) with the number of samples, and most of them
+    cannot embed new data.  Here the model is only fit on n_landmarks rows,
+    and each row is embedded as the inverse distance weighted mean of the
+    embeddings of its n_neighbors nearest landmarks, so the cost grows about
+    linearly with the number of rows.  Landmarks keep their own embedding.
+
+    Parameters
+    ----------
+    model : scikit-learn model
+        Model used to embed the landmarks.  It must have a fit_transform
+        method.
+
+    n_landmarks : int
+        Number of rows to fit the model on (default: 1000)
+
+    n_neighbors : int
+        Number of nearest landmarks used to place each row (default: 10)
+
+    random_state : int, RandomState instance or None
+        Seed used to pick the landmarks (default: 0)
+
+    Attributes
+    ----------
+    model_ : scikit-learn model
+        The model fit on the landmarks
+
+    landmarks_ : array, shape (n_landmarks, n_features)
+        The landmark rows
+
+    embedding_ : array, shape (n_landmarks, n_components)
+        Embedding of the landmarks
+
+    """
+
+    def __init__(self, model, n_landmarks=1000, n_neighbors=10, random_state=0):
+        self.model = model
+        self.n_landmarks = n_landmarks
+        self.n_neighbors = n_neighbors
+        self.random_state = random_state
+
+    def fit(self, X, y=None):
+        X = check_array(X, accept_sparse='csr')
+        n_samples = X.shape[0]
+        if n_samples > self.n_landmarks:
+            rng = check_random_state(self.random_state)
+            idx = np.sort(rng.choice(n_samples, self.n_landmarks, replace=False))
+            self.landmarks_ = X[idx]
+        else:
+            self.landmarks_ = X
+        self.model_ = clone(self.model)
+        self.embedding_ = self.model_.fit_transform(self.landmarks_)
+        self.nn_ = NearestNeighbors(
+            n_neighbors=min(self.n_neighbors, self.landmarks_.shape[0]))
+        self.nn_.fit(self.landmarks_)
+        return self
+
+    def fit_transform(self, X, y=None):
+        return self.fit(X).transform(X)
+
+    def transform(self, X):
+        X = check_array(X, accept_sparse='csr')
+        dist, idx = self.nn_.kneighbors(X)
+
+        # inverse distance weights, where a row that is a landmark is placed
+        # exactly on it
+        with np.errstate(divide='ignore'):
+            weights = 1. / dist
+        exact = np.isinf(weights)
+        on_landmark = exact.any(axis=1)
+        weights[on_landmark] = exact[on_landmark]
+        weights /= weights.sum(axis=1, keepdims=True)
+        return np.einsum('ij,ijk->ik', weights, self.embedding_[idx])
+
+class StandardizedPCA(BaseEstimator, TransformerMixin):
+    """
+    Principal component analysis of z-scored data, fit without z-scoring it
+
+    The column means and the co-moment matrix of the data are accumulated in
+    one pass over chunks of rows (merging chunks with Chan et al.'s pairwise
+    update), and the components are the leading eigenvectors of the
+    resulting correlation matrix.  fit_transform projects each chunk of the
+    raw data directly, folding the z-scoring into the projection, so no
+    z-scored copy of the data is made.  The components are those of PCA fit
+    to the z-scored data (up to their signs, which are chosen so that the
+    largest loading of each component is positive), and transform takes
+    z-scored data, like PCA fit to it would.  Columns with no variance are
+    left at zero.
+
+    Chan TF, Golub GH, and LeVeque RJ (1979) Updating formulae and a pairwise
+    algorithm for computing sample variances.  Stanford CS report 79-773.
+
+    Parameters
+    ----------
+    n_components : int
+        Number of components to keep
+
+    chunk_size : int or None
+        Number of rows read at a time.  If None, each array is read whole
+        (default: None).
+
+    Attributes
+    ----------
+    components_ : array, shape (n_components, n_features)
+        Principal axes in the z-scored feature space
+
+    mean_ : array, shape (n_features,)
+        Per-feature mean of the z-scored data (zeros)
+
+    data_mean_ : array, shape (n_features,)
+        Per-feature mean of the raw data
+
+    data_scale_ : array, shape (n_features,)
+        Per-feature (population) standard deviation of the raw data, or 1 for
+        features with no variance
+
+    explained_variance_ : array, shape (n_components,)
+        Variance explained by each component
+
+    explained_variance_ratio_ : array, shape (n_components,)
+        Fraction of the total variance explained by each component
+
+    constant_within_ : array, shape (n_features,)
+        True for features that are constant within at least one of the arrays
+        X was fit to, but not across all of them (normalize='across' sets
+        such features to zero in that array, which the fit does not)
+
+    """
+
+    def __init__(self, n_components=None, chunk_size=None):
+        self.n_components = n_components
+        self.chunk_size = chunk_size
+
+    def fit(self, X, y=None):
+        """
+        Fits the model to X, an array or a list of arrays (treated as if they
+        were stacked)
+        """
+        n_samples, mean, comoment, constant = self._moments(_as_arrays(X))
+        n_features = mean.shape[0]
+        n_components = self.n_components
+        if n_components is None:
+            n_components = min(n_samples, n_features)
+
+        std = np.sqrt(np.diag(comoment) / n_samples)
+        scale = np.where(std > 0, std, 1.)
+        corr = comoment / np.outer(scale, scale) / max(n_samples - 1, 1)
+
+        evals, evecs = np.linalg.eigh(corr)
+        evals = np.maximum(evals[::-1], 0)
+        components = evecs[:, ::-1][:, :n_components].T
+
+        # flip the signs so that the largest loading is positive
+        signs = np.sign(components[np.arange(n_components),
+                                   np.argmax(np.abs(components), axis=1)])
+        components *= signs[:, np.newaxis]
+
+        self.n_components_ = n_components
+        self.n_samples_ = n_samples
+        self.data_mean_ = mean
+        self.data_scale_ = scale
+        self.constant_within_ = np.any(constant, axis=0) & (std > 0)
+        self.mean_ = np.zeros(n_features)
+        self.components_ = components
+        self.explained_variance_ = evals[:n_components]
+        self.explained_variance_ratio_ = evals[:n_components] / \
+            max(evals.sum(), np.finfo(float).tiny)
+        self.singular_values_ = np.sqrt(evals[:n_components]
+                                        * max(n_samples - 1, 1))
+        return self
+
+    def fit_transform(self, X, y=None):
+        """
+        Fits the model to X (an array or a list of arrays), and returns the
+        projections of z-scored X
+        """
+        return self.fit(X).project(X)
+
+    def project(self, X):
+        """
+        Returns the projections of z-scored X, computed from the raw data X
+        (an array or a list of arrays) a chunk of rows at a time
+        """
+        weights = self.components_.T / self.data_scale_[:, np.newaxis]
+        offset = np.dot(self.data_mean_, weights)
+        projected = []
+        for x in _as_arrays(X):
+            dtype = np.result_type(np.float32, x.dtype)
+            out = np.empty((x.shape[0], self.n_components_), dtype=dtype)
+            for rows in _row_chunks(x, self.chunk_size):
+                out[rows] = np.dot(x[rows], weights.astype(dtype)) - \
+                    offset.astype(dtype)
+            projected.append(out)
+        if isinstance(X, list):
+            return projected
+        return projected[0]
+
+    def transform(self, X):
+        """Projects z-scored data X onto the components"""
+        X = check_array(X, dtype=[np.float64, np.float32])
+        return np.dot(X - self.mean_.astype(X.dtype),
+                      self.components_.T.astype(X.dtype))
+
+    def _moments(self, X):
+        """
+        Number of rows, column means and co-moment matrix of the stacked
+        arrays, and whether each column is constant within each array
+        """
+        n = 0
+        mean = np.zeros(X[0].shape[1])
+        comoment = np.zeros((X[0].shape[1],) * 2)
+        constant = np.zeros((len(X), X[0].shape[1]), dtype=bool)
+        for i, x in enumerate(X):
+            low = high = None
+            for rows in _row_chunks(x, self.chunk_size):
+                chunk = x[rows]
+                if low is None:
+                    low, high = chunk.min(axis=0), chunk.max(axis=0)
+                else:
+                    low = np.minimum(low, chunk.min(axis=0))
+                    high = np.maximum(high, chunk.max(axis=0))
+                n_chunk = chunk.shape[0]
+                mean_chunk = np.mean(chunk, axis=0, dtype=np.float64)
+                centered = chunk - mean_chunk
+                delta = mean_chunk - mean
+                total = n + n_chunk
+                mean += delta * n_chunk / total
+                comoment += np.dot(centered.T, centered) + \
+                    np.outer(delta, delta) * n * n_chunk / total
+                n = total
+            if low is not None:
+                constant[i] = low == high
+        return n, mean, comoment, constant
+
+def _as_arrays(X):
+    if isinstance(X, list):
+        return X
+    return [X]
+
+def _row_chunks(x, chunk_size):
+    if chunk_size is None:
+        chunk_size = max(x.shape[0], 1)
+    return [slice(start, start + chunk_size)
+            for start in range(0, x.shape[0], chunk_size)]
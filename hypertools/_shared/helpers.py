@@ -16,18 +16,20 @@ from scipy.interpolate import PchipInterpolator as pchip
 import seaborn as sns
 import itertools
 import pandas as pd
+import scipy.sparse as sp
 from matplotlib.lines import Line2D
 from .._externals.ppca import PPCA
+from .cache import memoize
 np.seterr(divide='ignore', invalid='ignore')
 
 ##HELPER FUNCTIONS##
 def center(x):
-    assert type(x) is list, "Input data to center must be list"
+    assert isinstance(x, list), "Input data to center must be list"
     x_stacked = np.vstack(x)
     return [i - np.mean(x_stacked, 0) for i in x]
 
 def scale(x):
-    assert type(x) is list, "Input data to scale must be list"
+    assert isinstance(x, list), "Input data to scale must be list"
     x_stacked = np.vstack(x)
     m1 = np.min(x_stacked)
     m2 = np.max(x_stacked - m1)
@@ -163,19 +165,41 @@ def is_line(format_str):
 
     return (format_str is None) or (all([str(symbol) not in format_str for symbol in markers]))
 
-import collections
-import functools
+def vstack(x):
+    """
+    Stacks a list of arrays by rows. If any of them is a scipy.sparse matrix,
+    the result is a sparse (CSR) matrix.
+    """
+    if any(sp.issparse(i) for i in x):
+        return sp.vstack(x, format='csr')
+    return np.vstack(x)
 
-def memoize(obj):
-    cache = obj.cache = {}
+def vsplit(x, split):
+    """
+    Splits an array or scipy.sparse matrix by rows at the indices in split
+    """
+    if sp.issparse(x):
+        x = x.tocsr()
+        bounds = [0] + list(split) + [x.shape[0]]
+        return [x[bounds[i]:bounds[i+1]] for i in range(len(bounds)-1)]
+    return [xi for xi in np.vsplit(x, split)]
 
-    @functools.wraps(obj)
-    def memoizer(*args, **kwargs):
-        key = str(args) + str(kwargs)
-        if key not in cache:
-            cache[key] = obj(*args, **kwargs)
-        return cache[key]
-    return memoizer
+def astype(x, dtype):
+    """
+    Converts a list of arrays (or scipy.sparse matrices) to dtype, without
+    copying the arrays that already have it.  If dtype is None, x is returned
+    as is.
+    """
+    if dtype is None:
+        return x
+    return [i.astype(dtype, copy=False) for i in x]
+
+def float_dtype(*arrays):
+    """
+    Returns the floating point type to compute with for arrays: float32 if
+    they are all float32 (or smaller), otherwise float64
+    """
+    return np.result_type(np.float32, *[a.dtype for a in arrays])
 
 def get_type(data):
     """
@@ -202,6 +226,8 @@ def get_type(data):
             return 'arr_num'
     elif isinstance(data, pd.DataFrame):
         return 'df'
+    elif sp.issparse(data):
+        return 'sparse'
     elif isinstance(data, (six.string_types, six.text_type, six.binary_type)):
         return 'str'
     elif isinstance(data, DataGeometry):
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""
+Shared k-nearest neighbors graphs
+
+Isomap, SpectralEmbedding, UMAP and SpectralClustering (with a
+nearest_neighbors affinity) all start by finding the nearest neighbors of
+every row.  The graph is built here once per dataset and fed to each model
+as a precomputed input, so fitting several of these models to the same data
+(or refitting one with different parameters) does not search for the
+neighbors again.
+"""
+
+##PACKAGES##
+from __future__ import division
+import numpy as np
+import scipy.sparse as sp
+from sklearn.cluster import SpectralClustering
+from sklearn.manifold import Isomap, SpectralEmbedding
+from sklearn.neighbors import NearestNeighbors
+from umap import UMAP
+from .cache import digest, named_cache
+
+try:
+    from pynndescent import NNDescent
+except ImportError:
+    NNDescent = None
+
+# datasets with at least this many rows use an approximate (nearest neighbor
+# descent) search, smaller ones an exact search
+APPROXIMATE_MIN_SAMPLES = 4096
+
+# neighbor graphs, by dataset, with the most neighbors requested so far
+graphs = named_cache('knn_graph')
+
+def kneighbors(x, n_neighbors):
+    """
+    Finds the (euclidean) nearest neighbors of each row of x
+
+    Each row counts as its own first neighbor.  The graph is cached, and a
+    request for fewer neighbors than a cached graph is answered from it.
+
+    Parameters
+    ----------
+    x : Numpy array
+        The data
+
+    n_neighbors : int
+        Number of neighbors of each row (including the row itself)
+
+    Returns
+    ----------
+    indices : Numpy array, shape (n_samples, n_neighbors)
+        Indices of the neighbors of each row, nearest first
+
+    distances : Numpy array, shape (n_samples, n_neighbors)
+        Distances to the neighbors of each row
+
+    search_index : pynndescent.NNDescent or None
+        Index that can be queried for the neighbors of new data (only for
+        approximate searches)
+
+    """
+    key = digest(x)
+    if key in graphs:
+        indices, distances, search_index = graphs[key]
+        if indices.shape[1] >= n_neighbors:
+            graphs.hits += 1
+            return indices[:, :n_neighbors], distances[:, :n_neighbors], \
+                   search_index
+    graphs.misses += 1
+
+    n_neighbors = min(n_neighbors, x.shape[0])
+    if NNDescent is not None and x.shape[0] >= APPROXIMATE_MIN_SAMPLES:
+        search_index = NNDescent(x, n_neighbors=n_neighbors, random_state=0)
+        indices, distances = search_index.neighbor_graph
+    else:
+        search_index = None
+        distances, indices = NearestNeighbors(
+            n_neighbors=n_neighbors).fit(x).kneighbors(x)
+    graphs[key] = (indices, distances, search_index)
+    return indices, distances, search_index
+
+def kneighbors_graph(x, n_neighbors):
+    """
+    Returns the nearest neighbors distance graph of x as a sparse matrix, in
+    the format scikit-learn models take as a 'precomputed' input
+    """
+    indices, distances, _ = kneighbors(x, n_neighbors)
+    n_samples, k = indices.shape
+    return sp.csr_matrix((distances.ravel(), indices.ravel(),
+                          np.arange(0, n_samples * k + 1, k)),
+                         shape=(n_samples, n_samples))
+
+def fit(model, x):
+    """Fits model to x, using the shared neighbors graph if it can"""
+    _fit(model, x, 'fit')
+    return model
+
+def fit_transform(model, x):
+    """Fits model to x and transforms it, using the shared neighbors graph if
+    it can"""
+    return _fit(model, x, 'fit_transform')
+
+def _fit(model, x, method):
+    if sp.issparse(x) or not _shares_graph(model, x):
+        return getattr(model, method)(x)
+
+    if isinstance(model, UMAP):
+        indices, distances, search_index = kneighbors(x, model.n_neighbors)
+        # umap modifies the graph it is given
+        return _with_params(model, method, x,
+                            precomputed_knn=(indices.copy(), distances.copy(),
+                                             search_index))
+
+    elif isinstance(model, Isomap):
+        # scikit-learn's n_neighbors does not count the row itself
+        graph = kneighbors_graph(x, model.n_neighbors + 1)
+        try:
+            result = _with_params(model, method, graph, metric='precomputed')
+        except RuntimeError:
+            # the graph has several connected components, which isomap can
+            # only join given the data
+            return getattr(model, method)(x)
+
+        # neighbors of new data are searched in the data, not the graph
+        model.nbrs_ = NearestNeighbors(
+            n_neighbors=model.n_neighbors, algorithm=model.neighbors_algorithm,
+            metric=model.metric, p=model.p, metric_params=model.metric_params,
+            n_jobs=model.n_jobs).fit(x)
+        return result
+
+    # SpectralEmbedding and SpectralClustering count the row itself
+    n_neighbors = model.n_neighbors
+    if n_neighbors is None:
+        n_neighbors = max(int(x.shape[0] / 10), 1)
+    graph = kneighbors_graph(x, n_neighbors)
+    return _with_params(model, method, graph,
+                        affinity='precomputed_nearest_neighbors',
+                        n_neighbors=n_neighbors)
+
+def _shares_graph(model, x):
+    if isinstance(model, UMAP):
+        # without a search index, umap could not transform new data
+        return model.metric == 'euclidean' and NNDescent is not None and \
+            x.shape[0] >= APPROXIMATE_MIN_SAMPLES
+    elif isinstance(model, Isomap):
+        return model.n_neighbors is not None and model.radius is None and \
+            (model.metric == 'euclidean' or
+             (model.metric == 'minkowski' and model.p == 2))
+    elif isinstance(model, (SpectralEmbedding, SpectralClustering)):
+        return model.affinity == 'nearest_neighbors'
+    return False
+
+def _with_params(model, method, x, **params):
+    # fit with params set for the precomputed graph, then restore them
+    original = dict((k, getattr(model, k)) for k in params)
+    model.set_params(**params)
+    try:
+        return getattr(model, method)(x)
+    finally:
+        model.set_params(**original)
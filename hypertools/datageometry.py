@@ -5,6 +5,7 @@ import deepdish as dd
 import numpy as np
 from .tools.normalize import normalize as normalizer
 from .tools.reduce import reduce as reducer
+from .tools.reduce import transform_list
 from .tools.align import align as aligner
 from .tools.format_data import format_data
 from ._shared.helpers import convert_text, get_dtype
@@ -51,12 +52,23 @@ class DataGeometry(object):
     version : str
         The version of the software used to create the class instance
 
+    reduce_model : scikit-learn model or None
+        The fitted reduction model.  If set, new data passed to `transform` is
+        projected with this model instead of refitting the reduction.  Note:
+        the fitted model is not saved with the object.
+
+    imputer : PPCA or None
+        The PPCA model that filled in missing values in the data, if any.
+        If set, missing values in new data passed to `transform` are filled
+        in from this model instead of fitting a new one.  Note: the fitted
+        model is not saved with the object.
+
     """
 
     def __init__(self, fig=None, ax=None, line_ani=None, data=None, xform_data=None,
                  reduce=None, align=None, normalize=None, semantic=None,
                  vectorizer=None, corpus=None, kwargs=None, version=__version__,
-                 dtype=None):
+                 dtype=None, reduce_model=None, imputer=None):
 
         # matplotlib figure handle
         self.fig = fig
@@ -97,6 +109,12 @@ class DataGeometry(object):
         # hypertools version
         self.version = version
 
+        # fitted reduction model (not saved)
+        self.reduce_model = reduce_model
+
+        # fitted missing data model (not saved)
+        self.imputer = imputer
+
     def get_data(self):
         """Return a copy of the data"""
         return copy.copy(self.data)
@@ -127,18 +145,25 @@ class DataGeometry(object):
         if data is None:
             return self.xform_data
         else:
-            return aligner(
-                reducer(
-                normalizer(
-                format_data(data,
-                semantic=self.semantic,
-                vectorizer=self.vectorizer,
-                corpus=self.corpus,
-                ppca=True),
-                normalize=self.normalize),
-                reduce=self.reduce,
-                ndims=self.reduce['params']['n_components']),
-                align=self.align)
+            formatted = format_data(data,
+                                    semantic=self.semantic,
+                                    vectorizer=self.vectorizer,
+                                    corpus=self.corpus,
+                                    ppca=True if self.imputer is None
+                                    else self.imputer)
+
+            # project into the space of the fitted model, if there is one
+            if hasattr(self.reduce_model, 'transform'):
+                reduced = transform_list(normalizer(formatted,
+                                                    normalize=self.normalize,
+                                                    internal=True),
+                                         self.reduce_model)
+            else:
+                reduced = reducer(normalizer(formatted,
+                                             normalize=self.normalize),
+                                  reduce=self.reduce,
+                                  ndims=self.reduce['params']['n_components'])
+            return aligner(reduced, align=self.align)
 
     # a function to plot the data
     def plot(self, data=None, **kwargs):
@@ -16,7 +16,7 @@ from .._shared.params import default_params
 from ..tools.analyze import analyze
 from ..tools.cluster import cluster as clusterer
 from ..tools.df2mat import df2mat
-from ..tools.reduce import reduce as reducer
+from ..tools.reduce import reduce as reducer, nested_models
 from ..tools.normalize import normalize as normalizer
 from ..tools.align import align as aligner
 from ..tools.text2mat import text2mat
@@ -33,7 +33,7 @@ def plot(x, fmt='-', marker=None, markers=None, linestyle=None, linestyles=None,
          rotations=2, zoom=1, chemtrails=False, precog=False, bullettime=False,
          frame_rate=50, explore=False, show=True, transform=None,
          vectorizer='CountVectorizer', semantic='LatentDirichletAllocation',
-         corpus='wiki', ax=None):
+         corpus='wiki', ax=None, dtype=None):
     """
     Plots dimensionality reduced data and parses plot arguments
 
@@ -93,7 +93,9 @@ def plot(x, fmt='-', marker=None, markers=None, linestyle=None, linestyles=None,
         passed as a string, but for finer control of the model parameters, pass
         as a dictionary, e.g. reduce={'model' : 'PCA', 'params' : {'whiten' : True}}.
         See scikit-learn specific model docs for details on parameters supported
-        for each model.
+        for each model.  For large data, manifold models can be fit on a subsample
+        of landmark rows, e.g. reduce={'model' : 'MDS', 'params' : None,
+        'landmarks' : 1000} (see hypertools.tools.reduce).
 
     ndims : int
         An `int` representing the number of dims to reduce the data x
@@ -214,6 +216,10 @@ def plot(x, fmt='-', marker=None, markers=None, linestyle=None, linestyles=None,
     ax : matplotlib.Axes
         Axis handle to plot the figure
 
+    dtype : numpy dtype or None
+        If set (e.g. np.float32), the data is converted to this type, and kept
+        in it through the normalize, reduce and align steps (default: None).
+
     Returns
     ----------
     geo : hypertools.DataGeometry
@@ -248,11 +254,15 @@ def plot(x, fmt='-', marker=None, markers=None, linestyle=None, linestyles=None,
 
     # analyze the data
     if transform is None:
-        raw = format_data(x, **text_args)
-        xform = analyze(raw, ndims=ndims, normalize=normalize, reduce=reduce,
-                    align=align, internal=True)
+        raw, imputer = format_data(x, dtype=dtype, return_model=True,
+                                   **text_args)
+        xform, models = analyze(raw, ndims=ndims, normalize=normalize,
+                                reduce=reduce, align=align, internal=True,
+                                return_model=True, dtype=dtype)
     else:
         xform = transform
+        models = {'reduce' : None, 'align' : None}
+        imputer = None
 
     # Return data that has been normalized and possibly reduced and/or aligned
     xform_data = copy.copy(xform)
@@ -286,9 +296,16 @@ def plot(x, fmt='-', marker=None, markers=None, linestyle=None, linestyles=None,
 
     # reduce data to 3 dims for plotting, if ndims is None, return this
     if (ndims and ndims < 3):
-        xform = reducer(xform, ndims=ndims, reduce=reduce, internal=True)
+        plot_dims = ndims
+    else:
+        plot_dims = 3
+
+    # the leading components of a PCA-family fit are already the best
+    # plot_dims dimensional projection of the data, so keep them
+    if isinstance(models['reduce'], nested_models) and not align:
+        xform = [i[:, :plot_dims] for i in xform]
     else:
-        xform = reducer(xform, ndims=3, reduce=reduce, internal=True)
+        xform = reducer(xform, ndims=plot_dims, reduce=reduce, internal=True)
 
     # find cluster and reshape if n_clusters
     if cluster is not None:
@@ -507,4 +524,5 @@ def plot(x, fmt='-', marker=None, markers=None, linestyle=None, linestyles=None,
     return DataGeometry(fig=fig, ax=ax, data=x, xform_data=xform_data,
                         line_ani=line_ani, reduce=reduce_dict, align=align_dict,
                         normalize=normalize, semantic=semantic,
-                        vectorizer=vectorizer, corpus=corpus, kwargs=kwargs)
+                        vectorizer=vectorizer, corpus=corpus, kwargs=kwargs,
+                        reduce_model=models['reduce'], imputer=imputer)
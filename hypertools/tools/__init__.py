@@ -5,7 +5,7 @@ from .missing_inds import missing_inds
 from .cluster import cluster
 from .df2mat import df2mat
 from .normalize import normalize
-from .procrustes import procrustes
+from .procrustes import procrustes, Procrustes
 from .load import load
 from .format_data import format_data
 from .text2mat import text2mat
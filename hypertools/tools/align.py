@@ -3,16 +3,19 @@
 from __future__ import division
 from builtins import range
 from .._externals.srm import SRM
-from .procrustes import procrustes
+from .procrustes import procrustes, batch_projections
 import numpy as np
-from .format_data import format_data as formatter
-from .._shared.helpers import memoize
+from .format_data import format_data as formatter, FormattedData
+from .._shared.helpers import memoize, astype, float_dtype
+from .._shared.cache import persist
 from .normalize import normalize as normalizer
 import warnings
+from joblib import Parallel, delayed, effective_n_jobs
 
-@memoize
+@memoize(skip='return_model')
+@persist
 def align(data, align='hyper', normalize=None, ndims=None, method=None,
-          format_data=True):
+          format_data=True, dtype=None, n_jobs=1, return_model=False):
     """
     Aligns a list of arrays
 
@@ -43,11 +46,40 @@ def align(data, align='hyper', normalize=None, ndims=None, method=None,
         hyperalignment. If 'SRM', alignment algorithm will be shared response
         model.  You can also pass a dictionary for finer control, where the 'model'
         key is a string that specifies the model and the params key is a dictionary
-        of parameter values (default : 'hyper').
+        of parameter values (default : 'hyper').  The SRM parameters include
+        n_iter, tol (stop early once the log-likelihood converges) and
+        likelihood_every (how often to evaluate it), e.g. {'model' : 'SRM',
+        'params' : {'n_iter' : 50, 'tol' : 1e-4}}.  With a chunk_size
+        parameter, SRM reads the data chunk_size samples at a time, so it can
+        be fit to memory-mapped arrays (e.g. from np.load(path,
+        mmap_mode='r')) larger than the memory; pass format_data=False so
+        they are not checked for missing data first.
 
     format_data : bool
         Whether or not to first call the format_data function (default: True).
 
+    dtype : numpy dtype or None
+        If set (e.g. np.float32), the data is converted to this type first.
+        The alignment is computed in the floating point type of the data, so
+        float32 data stays float32, which halves the memory used
+        (default: None).
+
+    n_jobs : int
+        Number of processes used to align the subjects to the template in the
+        second and third steps of hyperalignment.  The subjects and template
+        are shared with the processes through memory-mapped files, and the
+        result is identical to that of a single process.  For SRM, the number
+        of threads used to update the subjects' transforms in each iteration.
+        -1 uses all CPUs (default: 1).
+
+    return_model : bool
+        If True, an AlignmentModel holding the transform of each subject and
+        the template is returned along with the aligned data.  It can align
+        new data from a subject (`model.transform(subject_idx, data)`), or a
+        new subject (`model.add_subject(data)`) without refitting the group.
+        These calls are not memoized, so each returns a model of its own
+        (default: False).
+
     normalize : None
         Deprecated argument.  Please use new analyze function to perform
         combinations of transformations
@@ -61,14 +93,21 @@ def align(data, align='hyper', normalize=None, ndims=None, method=None,
     aligned : list
         An aligned list of numpy arrays
 
+    model : AlignmentModel or None
+        The fitted alignment (only returned if return_model=True).  None if
+        the data was not aligned.
+
     """
 
+    # a dict gives the model and its parameters
+    params = {}
+    if isinstance(align, dict):
+        params = align.get('params') or {}
+        align = align['model']
+
     # if model is None, just return data
     if align is None:
-        return data
-    elif isinstance(align, dict):
-        if align['model'] is None:
-            return data
+        return _with_model(data, None, return_model)
     else:
         if method is not None:
             warnings.warn('The method argument will be deprecated.  Please use align. See the API docs for more info: http://hypertools.readthedocs.io/en/latest/hypertools.tools.align.html#hypertools.tools.align')
@@ -79,9 +118,12 @@ def align(data, align='hyper', normalize=None, ndims=None, method=None,
                           type of alignment, i.e. align='hyper'. See API docs for more info: http://hypertools.readthedocs.io/en/latest/hypertools.tools.align.html#hypertools.tools.align")
             align = 'hyper'
 
-        # common format
+        # common format (the aligned data is marked as formatted if the data
+        # was)
+        formatted = isinstance(data, FormattedData)
         if format_data:
             data = formatter(data, ppca=True)
+        data = astype(data, dtype)
 
         if len(data) is 1:
             warnings.warn('Data in list of length 1 can not be aligned. '
@@ -92,7 +134,7 @@ def align(data, align='hyper', normalize=None, ndims=None, method=None,
                  to overfitting.  We recommend reducing the dimensionality to be \
                  less than the number of samples prior to hyperalignment.')
 
-        if (align is 'hyper') or (method is 'hyper'):
+        if (align == 'hyper') or (method == 'hyper'):
 
             ##STEP 0: STANDARDIZE SIZE AND SHAPE##
             sizes_0 = [x.shape[0] for x in data]
@@ -102,41 +144,160 @@ def align(data, align='hyper', normalize=None, ndims=None, method=None,
             R = min(sizes_0)
             C = max(sizes_1)
 
-            m = [np.empty((R,C), dtype=np.ndarray)] * len(data)
-
-            for idx,x in enumerate(data):
-                y = x[0:R,:]
-                missing = C - y.shape[1]
-                add = np.zeros((y.shape[0], missing))
-                y = np.append(y, add, axis=1)
-                m[idx]=y
+            # subjects with fewer features are not padded with blank
+            # columns; procrustes pads them implicitly
+            dtype = float_dtype(*data)
+            m = [x[0:R,:].astype(dtype, copy=False) for x in data]
 
             ##STEP 1: TEMPLATE##
             for x in range(0, len(m)):
                 if x==0:
-                    template = np.copy(m[x])
+                    template = np.zeros((R, C), dtype=dtype)
+                    template[:, :m[x].shape[1]] = m[x]
                 else:
-                    next = procrustes(m[x], template / (x + 1))
+                    next = procrustes(m[x], template / (x + 1), format_data=False)
                     template += next
             template /= len(m)
 
             ##STEP 2: NEW COMMON TEMPLATE##
-            #align each subj to the template from STEP 1
-            template2 = np.zeros(template.shape)
-            for x in range(0, len(m)):
-                next = procrustes(m[x], template)
-                template2 += next
-            template2 /= len(m)
+            #align each subj to the template from STEP 1 (all at once)
+            template2 = np.mean(_align_to(m, template, n_jobs)[0], axis=0)
 
             #STEP 3 (below): ALIGN TO NEW TEMPLATE
-            aligned = [np.zeros(template2.shape)] * len(m)
-            for x in range(0, len(m)):
-                next = procrustes(m[x], template2)
-                aligned[x] = next
-            return aligned
+            aligned, projections = _align_to(m, template2, n_jobs)
+            return _with_model(_as_formatted(list(aligned), formatted),
+                               AlignmentModel(projections, template2),
+                               return_model)
 
-        elif (align is 'SRM') or (method is 'SRM'):
+        elif (align == 'SRM') or (method == 'SRM'):
             data = [i.T for i in data]
-            srm = SRM(features=np.min([i.shape[0] for i in data]))
+            srm_params = {'features': np.min([i.shape[0] for i in data]),
+                          'n_jobs': n_jobs}
+            srm_params.update(params)
+            srm = SRM(**srm_params)
             fit = srm.fit(data)
-            return [i.T for i in srm.transform(data)]
+            return _with_model(_as_formatted([i.T for i in srm.transform(data)],
+                                             formatted),
+                               AlignmentModel(list(srm.w_), srm.s_.T,
+                                              scaling=False),
+                               return_model)
+
+class AlignmentModel(object):
+    """
+    The transform of each subject, and the template, learned by align
+
+    Parameters
+    ----------
+    projections : list of Numpy arrays
+        Subject i is aligned as np.dot(data, projections[i])
+
+    template : Numpy array
+        The common space the subjects were aligned to (the final template of
+        hyperalignment, or the shared response of SRM)
+
+    scaling : bool
+        Whether the projections include a scaling factor (hyperalignment) or
+        are orthogonal (SRM)
+
+    """
+
+    def __init__(self, projections, template, scaling=True):
+        self.projections = projections
+        self.template = template
+        self.scaling = scaling
+
+    def transform(self, subject_idx, data):
+        """
+        Aligns new data (e.g. a new session) from one of the subjects
+
+        Parameters
+        ----------
+        subject_idx : int
+            Index of the subject (in the list passed to align, or in the order
+            subjects were added)
+
+        data : Numpy array
+            The new data, with the same features as the subject's data
+
+        Returns
+        ----------
+        aligned : Numpy array
+            The data in the common space
+
+        """
+        return np.dot(data, self.projections[subject_idx])
+
+    def add_subject(self, data):
+        """
+        Aligns a new subject to the template with a single procrustes fit, and
+        adds its transform to the model
+
+        Parameters
+        ----------
+        data : Numpy array
+            The new subject's data.  Its first rows must be samples of the
+            same events as the rows of the template.
+
+        Returns
+        ----------
+        aligned : Numpy array
+            The data in the common space.  The subject's index for transform
+            is len(model.projections) - 1.
+
+        """
+        n_samples = self.template.shape[0]
+        if data.shape[0] < n_samples:
+            raise ValueError('The new subject has fewer samples (%d) than the '
+                             'template (%d).' % (data.shape[0], n_samples))
+        proj = batch_projections(data[np.newaxis, :n_samples], self.template,
+                                 scaling=self.scaling)[0]
+        self.projections.append(proj)
+        return self.transform(len(self.projections) - 1, data)
+
+def _align_to(m, template, n_jobs=1):
+    """
+    Aligns each subject in m to template.  Subjects with the same number of
+    features are aligned together, as one batch.  Returns the aligned subjects
+    and the projection of each subject.
+    """
+    aligned = np.empty((len(m),) + template.shape, dtype=template.dtype)
+    projections = [None] * len(m)
+    widths = np.array([x.shape[1] for x in m])
+    for width in np.unique(widths):
+        idx = np.flatnonzero(widths == width)
+        batch = np.stack([m[i] for i in idx])
+        proj = _align_batch(batch, template, n_jobs)
+        aligned[idx] = np.matmul(batch, proj)
+        for i, p in zip(idx, proj):
+            projections[i] = p
+    return aligned, projections
+
+def _align_batch(m, template, n_jobs=1):
+    """
+    Finds the projections of a stack of subjects to template, splitting the
+    subjects into contiguous groups over n_jobs processes
+    """
+    n_jobs = min(effective_n_jobs(n_jobs), len(m))
+    if n_jobs <= 1:
+        return batch_projections(m, template)
+
+    # max_nbytes=0 memory-maps m and template once for all processes, rather
+    # than pickling them for each task
+    bounds = np.linspace(0, len(m), n_jobs + 1).astype(int)
+    projections = Parallel(n_jobs=n_jobs, max_nbytes=0)(
+        delayed(_align_subjects)(m, template, start, stop)
+        for start, stop in zip(bounds[:-1], bounds[1:]))
+    return np.concatenate(projections)
+
+def _align_subjects(m, template, start, stop):
+    return batch_projections(m[start:stop], template)
+
+def _as_formatted(x, formatted):
+    if formatted:
+        return FormattedData(x, missing=False)
+    return x
+
+def _with_model(x, model, return_model):
+    if return_model:
+        return x, model
+    return x
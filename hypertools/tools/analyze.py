@@ -1,14 +1,34 @@
 #!/usr/bin/env python
 
-from .reduce import reduce as reducer
+import six
+import numpy as np
+import scipy.sparse as sp
+from .reduce import reduce as reducer, DEFAULT_BATCH_BYTES
 from .align import align as aligner
 from .normalize import normalize as normalizer
-from .format_data import format_data
+from .format_data import format_data, FormattedData
+from .._shared.cache import persist
+from .._shared.helpers import astype
+from .._shared.estimators import StandardizedPCA
 
-def analyze(data, normalize=None, reduce=None, ndims=None, align=None, internal=False):
+# normalize='across' followed by PCA is fused into a single pass over the
+# data (see StandardizedPCA) when the data has at most FUSED_MAX_FEATURES
+# features, whose correlation matrix is then cheap to decompose
+FUSED_MAX_FEATURES = 2000
+
+@persist
+def analyze(data, normalize=None, reduce=None, ndims=None, align=None,
+            internal=False, return_model=False, dtype=None):
     """
     Wrapper function for normalize -> reduce -> align transformations.
 
+    When the columns are z-scored 'across' arrays and reduced with PCA or
+    IncrementalPCA (with no other params), the two steps are fused: the
+    correlation matrix is accumulated in one pass over the data and the
+    projection folds in the z-scoring, so no normalized copy of the data is
+    made.  The returned reduce model is then a StandardizedPCA, which, like
+    the PCA it replaces, projects z-scored data.
+
     Parameters
     ----------
     data : numpy array, pandas df, or list of arrays/dfs
@@ -30,7 +50,9 @@ def analyze(data, normalize=None, reduce=None, ndims=None, align=None, internal=
         passed as a string, but for finer control of the model parameters, pass
         as a dictionary, e.g. reduce={'model' : 'PCA', 'params' : {'whiten' : True}}.
         See scikit-learn specific model docs for details on parameters supported
-        for each model.
+        for each model.  For large data, manifold models can be fit on a subsample
+        of landmark rows, e.g. reduce={'model' : 'MDS', 'params' : None,
+        'landmarks' : 1000} (see hypertools.tools.reduce).
 
     ndims : int
         Number of dimensions to reduce
@@ -42,13 +64,97 @@ def analyze(data, normalize=None, reduce=None, ndims=None, align=None, internal=
         key is a string that specifies the model and the params key is a dictionary
         of parameter values (default : 'hyper').
 
+    return_model : bool
+        If True, the fitted models are returned along with the processed data
+        (default: False).
+
+    dtype : numpy dtype or None
+        If set (e.g. np.float32), the data is converted to this type, and kept
+        in it through the normalize, reduce and align steps (default: None).
+
     Returns
     ----------
     analyzed_data : list of numpy arrays
         The processed data
 
+    models : dict
+        The fitted models, keyed by step ('reduce' and 'align').  Only
+        returned if return_model=True.
+
     """
 
+    # normalize and reduce the data, in one pass if possible.  The models are
+    # only requested when they are returned, so that the results of the
+    # steps alone can be stored in the disk cache
+    if _fuses(data, normalize, reduce, ndims):
+        data = astype(format_data(data, ppca=True), dtype)
+        fused = _normalize_reduce(data, ndims, internal, dtype) \
+            if _fusable_data(data, ndims) else None
+        if fused is not None:
+            reduced, reduce_model = fused
+        else:
+            reduced, reduce_model = _split_model(reducer(
+                normalizer(data, normalize=normalize, internal=internal,
+                           format_data=False),
+                reduce=reduce, ndims=ndims, internal=internal,
+                return_model=return_model, format_data=False, dtype=dtype),
+                return_model)
+    else:
+        reduced, reduce_model = _split_model(
+            reducer(normalizer(data, normalize=normalize, internal=internal,
+                               dtype=dtype),
+                    reduce=reduce, ndims=ndims, internal=internal,
+                    return_model=return_model, dtype=dtype),
+            return_model)
+
     # return processed data
-    return aligner(reducer(normalizer(data, normalize=normalize, internal=internal),
-                   reduce=reduce, ndims=ndims, internal=internal), align=align)
+    aligned, align_model = _split_model(
+        aligner(reduced, align=align, dtype=dtype, return_model=return_model),
+        return_model)
+    if return_model:
+        return aligned, {'reduce' : reduce_model, 'align' : align_model}
+    return aligned
+
+def _split_model(result, return_model):
+    if return_model:
+        return result
+    return result, None
+
+def _fuses(data, normalize, reduce, ndims):
+    """Whether normalize and reduce can run as one StandardizedPCA fit"""
+    if normalize != 'across' or not ndims or callable(data):
+        return False
+    if isinstance(reduce, dict):
+        if reduce.get('landmarks') or \
+                set(reduce.get('params') or {}) - set(['n_components']):
+            return False
+        reduce = reduce.get('model')
+    return isinstance(reduce, six.string_types) and \
+        reduce in ('PCA', 'IncrementalPCA')
+
+def _fusable_data(x, ndims):
+    if any(sp.issparse(i) for i in x):
+        return False
+    n_rows = sum(i.shape[0] for i in x)
+    n_features = x[0].shape[1]
+    return all(i.shape[1] == n_features for i in x) and \
+        ndims < n_features <= min(n_rows, FUSED_MAX_FEATURES)
+
+def _normalize_reduce(x, ndims, internal, dtype=None):
+    """
+    Z-scores x across arrays and reduces it with PCA, in one pass.  Returns
+    None if a column is constant within one of the arrays but not across
+    all of them: normalize zeroes such columns in that array, which the
+    fused fit cannot.
+    """
+    chunk_size = max(DEFAULT_BATCH_BYTES // (8 * x[0].shape[1]), 1)
+    model = StandardizedPCA(n_components=ndims, chunk_size=chunk_size)
+    model.fit(list(x))
+    if np.any(model.constant_within_):
+        return None
+    reduced = astype(model.project(list(x)), dtype)
+    if internal:
+        return FormattedData(reduced, missing=False), model
+    elif len(reduced)>1:
+        return reduced, model
+    return reduced[0], model
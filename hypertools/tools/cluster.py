@@ -5,6 +5,7 @@ import numpy as np
 import six
 from hdbscan import HDBSCAN
 from .._shared.helpers import *
+from .._shared import knn
 from .format_data import format_data as formatter
 
 @memoize
@@ -85,8 +86,9 @@ def cluster(x, cluster='KMeans', n_clusters=3, ndims=None, format_data=True):
         # initialize model
         model = model(**model_params)
 
-        # fit the model
-        model.fit(np.vstack(x))
+        # fit the model (sharing the nearest neighbors graph of the data with
+        # other models that need it)
+        knn.fit(model, np.vstack(x))
 
         # return the labels
         return list(model.labels_)
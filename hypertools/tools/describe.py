@@ -64,7 +64,7 @@ def describe(x, reduce='IncrementalPCA', max_dims=None, show=True,
     def summary(x, max_dims=None):
 
         # if data is a list, stack it
-        if type(x) is list:
+        if isinstance(x, list):
             x = np.vstack(x)
 
         # if max dims is not set, make it the length of the minimum number of columns
@@ -77,12 +77,21 @@ def describe(x, reduce='IncrementalPCA', max_dims=None, show=True,
         # correlation matrix for all dimensions
         alldims = get_cdist(x)
 
+        # start with the most dimensions, so that PCA (with an exact solver)
+        # is fit once and sliced for fewer dimensions (see reduce)
         corrs=[]
-        for dims in range(2, max_dims):
-            reduced = get_cdist(reducer(x, ndims=dims, reduce=reduce))
+        for dims in range(max_dims-1, 1, -1):
+            reduced = get_cdist(reducer(x, ndims=dims, reduce=model))
             corrs.append(get_corr(alldims, reduced))
             del reduced
-        return corrs
+        return corrs[::-1]
+
+    # incremental and randomized PCA fits change with the number of
+    # dimensions, so PCA-family models are fit exactly instead
+    if reduce in ('PCA', 'IncrementalPCA', 'RandomizedPCA'):
+        model = {'model' : 'PCA', 'params' : {'svd_solver' : 'full'}}
+    else:
+        model = reduce
 
     # common format
     if format_data:
@@ -5,13 +5,46 @@ import six
 from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from .._externals.ppca import PPCA
 from .._shared.params import default_params
-from .._shared.helpers import get_type
+from .._shared.helpers import get_type, astype
+
+# PPCA is fit on (at most) this many randomly chosen rows, and the missing
+# values of the other rows are filled in from the fitted model
+PPCA_MAX_FIT_ROWS = 10000
+
+class FormattedData(list):
+    """
+    A list of arrays that format_data has already formatted
+
+    format_data returns it as is when it is passed back (after converting it
+    to dtype, if given), so the stages of a pipeline (e.g. plot -> normalize
+    -> reduce -> align) only pay the cost of formatting the data once.
+
+    Parameters
+    ----------
+    data : list of arrays
+        The formatted arrays
+
+    missing : bool or None
+        False if the arrays were checked for missing data (NaNs) and have
+        none, True if they were checked and still have some, None if they
+        were not checked (default: None).
+
+    """
+
+    def __init__(self, data=(), missing=None):
+        super(FormattedData, self).__init__(data)
+        self.missing = missing
 
 def format_data(x, vectorizer='CountVectorizer',
-                semantic='LatentDirichletAllocation', corpus='wiki', ppca=True, text_align='hyper'):
+                semantic='LatentDirichletAllocation', corpus='wiki', ppca=True, text_align='hyper',
+                dtype=None, return_model=False):
     """
     Formats data into a list of numpy arrays
 
+    Scipy.sparse matrices are passed through as they are (and are not
+    checked for missing data), so that sparse data stays sparse until a
+    model that needs dense input is applied.
+
     This function is useful to identify rows of your array that contain missing
     data or nans.  The returned indices can be used to remove the rows with
     missing data, or label the missing data points that are interpolated
@@ -20,7 +53,7 @@ def format_data(x, vectorizer='CountVectorizer',
     Parameters
     ----------
 
-    x : numpy array, dataframe, string or (mixed) list
+    x : numpy array, scipy.sparse matrix, dataframe, string or (mixed) list
         The data to convert
 
     vectorizer : str, dict, class or class instance
@@ -52,8 +85,12 @@ def format_data(x, vectorizer='CountVectorizer',
          or 'sotus' and the default semantic and vectorizer models are used, a
          pretrained model will be loaded which can save a lot of time.
 
-    ppca : bool
-        Performs PPCA to fill in missing values (default: True)
+    ppca : bool or PPCA
+        Performs PPCA to fill in missing values (default: True).  A PPCA
+        model already fit by format_data (see return_model) fills in the
+        missing values of new data from its loadings instead of fitting a new
+        model, and projects the numerical data into the same space as the
+        data it was fit to.
 
     text_align : str
         Alignment algorithm to use when both text and numerical data are passed.
@@ -64,19 +101,40 @@ def format_data(x, vectorizer='CountVectorizer',
         the movie and text will be automatically aligned to the same space
         (default: hyperalignment).
 
+    dtype : numpy dtype or None
+        If set (e.g. np.float32), the formatted arrays are converted to this
+        type, and missing data is filled in with it (default: None).
+
+    return_model : bool
+        If True, the PPCA model used to fill in missing data (or None, if no
+        data was missing) is returned along with the formatted data, so that
+        it can be passed back as ppca to format new data the same way
+        (default: False).
+
     Returns
     ----------
-    data : list of numpy arrays
+    data : FormattedData (list of numpy arrays)
         A list of formatted arrays
+
+    model : PPCA or None
+        The PPCA model (only returned if return_model=True)
     """
 
+    # already formatted data is returned as is, unless it should be, but was
+    # not, checked for missing data
+    fill = ppca is True or isinstance(ppca, PPCA)
+    if isinstance(x, FormattedData) and not (fill and x.missing is not False):
+        if dtype is not None:
+            x = FormattedData(astype(x, dtype), missing=x.missing)
+        return _with_model(x, None, return_model)
+
     # not sure why i needed to import here, but its the only way I could get it to work
     from .df2mat import df2mat
     from .text2mat import text2mat
     from ..datageometry import DataGeometry
 
     # if x is not a list, make it one
-    if type(x) is not list:
+    if not isinstance(x, list):
         x = [x]
 
     if all([isinstance(xi, six.string_types) for xi in x]):
@@ -106,13 +164,13 @@ def format_data(x, vectorizer='CountVectorizer',
     # replace the text data with transformed data
     processed_x = []
     textidx=0
-    for i, dtype in enumerate(dtypes):
-        if dtype in ['list_str', 'str', 'arr_str']:
+    for i, data_type in enumerate(dtypes):
+        if data_type in ['list_str', 'str', 'arr_str']:
             processed_x.append(text_data[textidx])
             textidx+=1
-        elif dtype is 'df':
+        elif data_type is 'df':
             processed_x.append(df2mat(x[i]))
-        elif dtype is 'geo':
+        elif data_type is 'geo':
             text_args = {
                 'vectorizer' : vectorizer,
                 'semantic' : semantic,
@@ -126,26 +184,37 @@ def format_data(x, vectorizer='CountVectorizer',
     # reshape anything that is 1d
     if any([i.ndim<=1 for i in processed_x]):
         processed_x = [np.reshape(i,(i.shape[0],1)) if i.ndim==1 else i for i in processed_x]
+    processed_x = astype(processed_x, dtype)
 
-    contains_text = any([dtype in ['list_str', 'str', 'arr_str'] for dtype in dtypes])
-    contains_num = any([dtype in ['list_num', 'array', 'df', 'arr_num'] for dtype in dtypes])
+    contains_text = any([data_type in ['list_str', 'str', 'arr_str'] for data_type in dtypes])
+    contains_num = any([data_type in ['list_num', 'array', 'df', 'arr_num'] for data_type in dtypes])
 
-    # if there are any nans in any of the lists, use ppca
-    if ppca is True:
+    # if there are any nans in any of the lists, use ppca.  A fitted model
+    # is applied to all of the numerical data.
+    missing = None
+    model = None
+    if fill:
+        missing = False
         if contains_num:
             num_data = []
             for i,j in zip(processed_x, dtypes):
                 if j in ['list_num', 'array', 'df', 'arr_num']:
                     num_data.append(i)
-            if np.isnan(np.vstack(num_data)).any():
-                warnings.warn('Missing data: Inexact solution computed with PPCA (see https://github.com/allentran/pca-magic for details)')
-                num_data = fill_missing(num_data)
+            masks = [np.isnan(i) for i in num_data]
+            fitted = ppca if isinstance(ppca, PPCA) else None
+            if fitted is not None or any(mask.any() for mask in masks):
+                if fitted is None:
+                    warnings.warn('Missing data: Inexact solution computed with PPCA (see https://github.com/allentran/pca-magic for details)')
+                num_data, model = fill_missing(num_data, masks, model=fitted,
+                                               return_model=True)
                 x_temp = []
-                for dtype in dtypes:
-                    if dtype in ['list_str', 'str', 'arr_str']:
+                for data_type in dtypes:
+                    if data_type in ['list_str', 'str', 'arr_str']:
                         x_temp.append(text_data.pop(0))
-                    elif dtype in ['list_num', 'array', 'df', 'arr_num']:
+                    elif data_type in ['list_num', 'array', 'df', 'arr_num']:
                         x_temp.append(num_data.pop(0))
+                    elif data_type == 'sparse':
+                        x_temp.append(processed_x[len(x_temp)])
                 processed_x = x_temp
 
     # if input data contains both text and numerical data
@@ -159,26 +228,76 @@ def format_data(x, vectorizer='CountVectorizer',
             # align the data
             warnings.warn('Numerical and text data with same number of '
                           'samples detected.  Aligning data to a common space.')
-            processed_x = aligner(processed_x, align=text_align, format_data=False)
+            processed_x = aligner(processed_x, align=text_align, format_data=False,
+                                  dtype=dtype)
 
-    return processed_x
+    return _with_model(FormattedData(processed_x, missing=missing), model,
+                       return_model)
 
-def fill_missing(x):
+def fill_missing(x, masks=None, model=None, return_model=False):
+    """
+    Fills in the missing data (NaNs) of a list of arrays with PPCA
+
+    The arrays are only stacked (and PPCA fit to them) if some data is
+    missing; otherwise they are returned as they are.
+
+    Parameters
+    ----------
+    x : list of numpy arrays
+        The arrays, with the same number of columns
+
+    masks : list of boolean numpy arrays or None
+        np.isnan of each array, if already computed (default: None)
+
+    model : PPCA or None
+        A fitted PPCA model.  If set, the missing data is filled in from its
+        loadings, and all the arrays are projected with it, whether or not
+        they have missing data (default: None).
+
+    return_model : bool
+        If True, the PPCA model is also returned (default: False)
 
-    # ppca if missing data
-    m = PPCA()
-    m.fit(data=np.vstack(x))
-    x_pca = m.transform()
+    Returns
+    ----------
+    filled : list of numpy arrays
+        The arrays, projected by PPCA with the missing data filled in
+
+    model : PPCA or None
+        The fitted (or given) PPCA model, or None if no data was missing
+        (only returned if return_model=True)
+
+    """
+    if masks is None:
+        masks = [np.isnan(i) for i in x]
+    if model is None and not any(mask.any() for mask in masks):
+        return _with_model(list(x), None, return_model)
+
+    # rows with no data at all are filled in from the model alone
+    n_empty = sum(int(np.all(mask, axis=1).sum()) for mask in masks)
+    if n_empty > 0:
+        warnings.warn('%d rows have no data; their values are entirely '
+                      'imputed by PPCA.' % n_empty)
 
-    # if the whole row is missing, return nans
-    all_missing = [idx for idx,a in enumerate(np.vstack(x)) if all([type(b)==np.nan for b in a])]
-    if len(all_missing)>0:
-        for i in all_missing:
-            x_pca[i,:]=np.nan
+    if model is None:
+        # ppca if missing data (seeded, so the same data is always filled in
+        # the same way)
+        model = PPCA()
+        model.fit(data=np.vstack(x), n_fit=PPCA_MAX_FIT_ROWS,
+                  chunk_size=PPCA_MAX_FIT_ROWS, random_state=0)
+        x_pca = model.transform()
+    else:
+        x_pca = model.transform(model.impute(np.vstack(x),
+                                             chunk_size=PPCA_MAX_FIT_ROWS))
 
     # get the original lists back
     if len(x)>1:
         x_split = np.cumsum([i.shape[0] for i in x][:-1])
-        return list(np.split(x_pca, x_split, axis=0))
+        x_pca = list(np.split(x_pca, x_split, axis=0))
     else:
-        return [x_pca]
+        x_pca = [x_pca]
+    return _with_model(x_pca, model, return_model)
+
+def _with_model(x, model, return_model):
+    if return_model:
+        return x, model
+    return x
@@ -3,11 +3,13 @@ from __future__ import division
 from builtins import range
 from sklearn.preprocessing import FunctionTransformer
 import numpy as np
-from .format_data import format_data as formatter
-from .._shared.helpers import memoize
+import scipy.sparse as sp
+from .format_data import format_data as formatter, FormattedData
+from .._shared.helpers import memoize, astype, float_dtype
 
-@memoize
-def normalize(x, normalize='across', internal=False, format_data=True):
+@memoize(skip='inplace')
+def normalize(x, normalize='across', internal=False, format_data=True,
+              dtype=None, inplace=False, chunk_size=None):
     """
     Z-transform the columns or rows of an array, or list of arrays
 
@@ -18,6 +20,12 @@ def normalize(x, normalize='across', internal=False, format_data=True):
     normalize the columns 'within' each individual list, or alternatively, for
     each row in the array.
 
+    The means and variances are accumulated in double precision over chunks
+    of rows (merging the chunks with Chan et al.'s pairwise update), and the
+    arrays are never stacked, so memory-mapped arrays can be normalized a
+    chunk at a time.  Columns (or rows) that are constant within an array are
+    set to zero.
+
     Parameters
     ----------
     x : Numpy array or list of arrays
@@ -34,6 +42,20 @@ def normalize(x, normalize='across', internal=False, format_data=True):
     format_data : bool
         Whether or not to first call the format_data function (default: True).
 
+    dtype : numpy dtype or None
+        If set (e.g. np.float32), the data is converted to this type first.
+        The z-scores are returned in the floating point type of the data
+        (default: None).
+
+    inplace : bool
+        If True, arrays that are writeable and already floating point are
+        overwritten with their z-scores instead of being copied.  Such calls
+        are never answered from (or stored in) the cache (default: False).
+
+    chunk_size : int or None
+        Number of rows read at a time.  If None, each array is processed
+        whole (default: None).
+
     Returns
     ----------
     normalized_x : Numpy array or list of arrays
@@ -52,22 +74,95 @@ def normalize(x, normalize='across', internal=False, format_data=True):
         if format_data:
             x = formatter(x, ppca=True)
 
-        zscore = lambda X,y: (y - np.mean(X)) / np.std(X) if len(set(y))>1 else np.zeros(y.shape)
+        missing = getattr(x, 'missing', None)
+
+        # z-scoring removes sparsity, so work on dense copies of sparse data
+        x = [i.toarray() if sp.issparse(i) else i for i in x]
+        x = astype(x, dtype)
 
         if normalize=='across':
-            x_stacked=np.vstack(x)
-            normalized_x = [np.array([zscore(x_stacked[:,j], i[:,j]) for j in range(i.shape[1])]).T for i in x]
+            mean, std = _moments(x, chunk_size)
+            normalized_x = [_zscore(i, mean, std, chunk_size, inplace) for i in x]
 
         elif normalize=='within':
-            normalized_x = [np.array([zscore(i[:,j], i[:,j]) for j in range(i.shape[1])]).T for i in x]
+            normalized_x = [_zscore(i, *_moments([i], chunk_size),
+                                    chunk_size=chunk_size, inplace=inplace)
+                            for i in x]
 
         elif normalize=='row':
-            normalized_x = [np.array([zscore(i[j,:], i[j,:]) for j in range(i.shape[0])]) for i in x]
-
-        elif normalize==False:
-            normalized_x = x
+            normalized_x = [_zscore_rows(i, chunk_size, inplace) for i in x]
 
-        if internal or len(normalized_x)>1:
+        if internal:
+            return FormattedData(normalized_x, missing=missing)
+        elif len(normalized_x)>1:
             return normalized_x
         else:
             return normalized_x[0]
+
+def _chunks(x, chunk_size):
+    """Slices of (at most) chunk_size rows of x"""
+    if chunk_size is None:
+        chunk_size = max(x.shape[0], 1)
+    return [slice(start, start + chunk_size)
+            for start in range(0, x.shape[0], chunk_size)]
+
+def _moments(x, chunk_size=None):
+    """
+    Means and (population) standard deviations of the columns of a list of
+    arrays, as if they were stacked
+    """
+    n = 0
+    mean = np.zeros(x[0].shape[1])
+    m2 = np.zeros(x[0].shape[1])
+    for i in x:
+        for rows in _chunks(i, chunk_size):
+            chunk = i[rows]
+            n_chunk = chunk.shape[0]
+            mean_chunk = np.mean(chunk, axis=0, dtype=np.float64)
+            m2_chunk = np.sum(np.square(chunk - mean_chunk), axis=0)
+
+            # merge the moments of the chunk with the running moments
+            delta = mean_chunk - mean
+            total = n + n_chunk
+            mean += delta * n_chunk / total
+            m2 += m2_chunk + np.square(delta) * n * n_chunk / total
+            n = total
+    return mean, np.sqrt(m2 / n)
+
+def _output(x, inplace):
+    if inplace and x.dtype == float_dtype(x) and x.flags.writeable:
+        return x
+    return np.empty(x.shape, dtype=float_dtype(x))
+
+def _zscore(x, mean, std, chunk_size=None, inplace=False):
+    """
+    Z-scores the columns of x with the given means and standard deviations.
+    Columns that are constant in x are set to zero.
+    """
+    out = _output(x, inplace)
+    first = np.array(x[:1])
+    constant = np.ones(x.shape[1], dtype=bool)
+    mean = mean.astype(out.dtype)
+    std = np.where(std > 0, std, 1).astype(out.dtype)
+    for rows in _chunks(x, chunk_size):
+        chunk = x[rows]
+        constant &= np.all(chunk == first, axis=0)
+        out[rows] = (chunk - mean) / std
+    out[:, constant] = 0
+    return out
+
+def _zscore_rows(x, chunk_size=None, inplace=False):
+    """
+    Z-scores the rows of x.  Constant rows are set to zero.
+    """
+    out = _output(x, inplace)
+    for rows in _chunks(x, chunk_size):
+        chunk = x[rows]
+        mean = np.mean(chunk, axis=1, dtype=np.float64)[:, np.newaxis]
+        std = np.sqrt(np.mean(np.square(chunk - mean), axis=1))[:, np.newaxis]
+        mean = mean.astype(out.dtype)
+        std = np.where(std > 0, std, 1).astype(out.dtype)
+        constant = np.all(chunk == chunk[:, :1], axis=1)
+        out[rows] = (chunk - mean) / std
+        out[rows][constant] = 0
+    return out
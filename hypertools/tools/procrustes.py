@@ -4,9 +4,10 @@ from builtins import zip
 from builtins import range
 import numpy as np
 from .format_data import format_data as formatter
+from .._shared.helpers import astype, float_dtype
 
 def procrustes(source, target, scaling=True, reflection=True, reduction=False,
-               oblique=False, oblique_rcond=-1, format_data=True):
+               oblique=False, oblique_rcond=-1, format_data=True, dtype=None):
     """
     Function to project from one space to another using Procrustean
     transformation (shift + scaling + rotation + reflection).
@@ -16,6 +17,9 @@ def procrustes(source, target, scaling=True, reflection=True, reduction=False,
 
     See also: http://en.wikipedia.org/wiki/Procrustes_transformation
 
+    To apply the same transformation to other data (e.g. other sessions or
+    time windows of the source), fit a Procrustes object once instead.
+
     Parameters
     ----------
     source : Numpy array
@@ -48,6 +52,11 @@ def procrustes(source, target, scaling=True, reflection=True, reduction=False,
         inverse. See :class:`~numpy.linalg.lstsq` for more
         information.
 
+    dtype : numpy dtype or None
+        If set (e.g. np.float32), source and target are converted to this type
+        first.  The alignment is computed in the floating point type of the
+        data, so float32 data stays float32 (default: None).
+
     Returns
     ----------
     aligned_source : Numpy array
@@ -55,55 +64,113 @@ def procrustes(source, target, scaling=True, reflection=True, reduction=False,
 
     """
 
-    _scale = None
+    if format_data:
+        source, target = formatter([source, target])
+
+    # fit and transform
+    mapper = Procrustes(scaling=scaling, reflection=reflection,
+                        reduction=reduction, oblique=oblique,
+                        oblique_rcond=oblique_rcond, dtype=dtype)
+    return mapper.fit(source, target).transform(source)
+
+class Procrustes(object):
+    """
+    A Procrustean transformation that is fit once and applied to any data
+
+    Fitting finds the projection from source to target (see procrustes for
+    the parameters) from the SVD of their features by features cross
+    product, so its cost hardly depends on the number of samples beyond the
+    cross product itself.  transform then applies the projection with a
+    single matrix product, e.g. to other sessions or sliding windows of the
+    source.
+
+    Attributes
+    ----------
+    proj_ : Numpy array, shape (n_source_features, n_target_features)
+        The projection, including the scaling
+
+    scale_ : float
+        The global scaling factor of the transformation (applied to proj_
+        only if scaling=True)
 
-    def fit(source, target):
+    """
 
+    def __init__(self, scaling=True, reflection=True, reduction=False,
+                 oblique=False, oblique_rcond=-1, dtype=None):
+        self.scaling = scaling
+        self.reflection = reflection
+        self.reduction = reduction
+        self.oblique = oblique
+        self.oblique_rcond = oblique_rcond
+        self.dtype = dtype
+
+    def fit(self, source, target):
+        """
+        Finds the projection of source to target
+
+        Parameters
+        ----------
+        source : Numpy array
+            Array to be aligned to target's coordinate system.
+
+        target: Numpy array
+            Source is aligned to this target space
+
+        Returns
+        ----------
+        self : Procrustes
+            The fitted transformation
+
+        """
+        source, target = astype([source, target], self.dtype)
         datas = (source, target)
         sn, sm = source.shape
         tn, tm = target.shape
 
         # Check the sizes
         if sn != tn:
-            pass
             raise ValueError("Data for both spaces should have the same " \
                   "number of samples. Got %d in template and %d in target space" \
                   % (sn, tn))
 
-        # Sums of squares
-        ssqs = [np.sum(d**2, axis=0) for d in datas]
+        # Sums of squares (accumulated in double precision)
+        dtype = float_dtype(source, target)
+        ssqs = [np.sum(np.square(d, dtype=np.float64), axis=0) for d in datas]
 
         # XXX check for being invariant?
         #     needs to be tuned up properly and not raise but handle
         for i in range(2):
-            if np.all(ssqs[i] <= np.abs((np.finfo(datas[i].dtype).eps
+            if np.all(ssqs[i] <= np.abs((np.finfo(dtype).eps
                                        * sn )**2)):
                 raise ValueError("For now do not handle invariant in time datasets")
 
         norms = [ np.sqrt(np.sum(ssq)) for ssq in ssqs ]
-        normed = [ data/norm for (data, norm) in zip(datas, norms) ]
-
-        # add new blank dimensions to template space if needed
-        if sm < tm:
-            normed[0] = np.hstack( (normed[0], np.zeros((sn, tm-sm))) )
-
-        if sm > tm:
-            if reduction:
-                normed[1] = np.hstack( (normed[1], np.zeros((sn, sm-tm))) )
-            else:
-                raise ValueError("reduction=False, so mapping from " \
-                      "higher dimensionality " \
-                      "template space is not supported. template space had %d " \
-                      "while target %d dimensions (features)" % (sm, tm))
+        normed = [ (data/norm).astype(dtype, copy=False)
+                   for (data, norm) in zip(datas, norms) ]
+
+        if sm > tm and not self.reduction:
+            raise ValueError("reduction=False, so mapping from " \
+                  "higher dimensionality " \
+                  "template space is not supported. template space had %d " \
+                  "while target %d dimensions (features)" % (sm, tm))
+
+        # add new blank dimensions to template space if needed.  The
+        # orthogonal transformation with reflections pads implicitly: the
+        # blank dimensions add nothing to the cross product of the spaces.
+        if self.oblique or not self.reflection:
+            if sm < tm:
+                normed[0] = np.hstack( (normed[0], np.zeros((sn, tm-sm), dtype=dtype)) )
+            if sm > tm:
+                normed[1] = np.hstack( (normed[1], np.zeros((sn, sm-tm), dtype=dtype)) )
 
         source, target = normed
-        if oblique:
+        if self.oblique:
             # Just do silly linear system of equations ;) or naive
             # inverse problem
             if sn == sm and tm == 1:
                 T = np.linalg.solve(source, target)
             else:
-                T = np.linalg.lstsq(source, target, rcond=oblique_rcond)[0]
+                T = np.linalg.lstsq(source, target, rcond=self.oblique_rcond)[0]
             ss = 1.0
         else:
             # Orthogonal transformation
@@ -112,7 +179,7 @@ def procrustes(source, target, scaling=True, reflection=True, reduction=False,
                                      full_matrices=False)
             T = np.dot(Vh.T, U.T)
 
-            if not reflection:
+            if not self.reflection:
                 # then we need to assure that it is only rotation
                 # "recipe" from
                 # http://en.wikipedia.org/wiki/Orthogonal_Procrustes_problem
@@ -134,28 +201,102 @@ def procrustes(source, target, scaling=True, reflection=True, reduction=False,
         if sm != tm:
             T = T[:sm, :tm]
 
-        _scale = scale = ss * norms[1] / norms[0]
+        self.scale_ = ss * norms[1] / norms[0]
         # Assign projection
-        if scaling:
-            proj = scale * T
+        if self.scaling:
+            proj = self.scale_ * T
         else:
             proj = T
-        return proj
+        self.proj_ = proj.astype(dtype, copy=False)
+        return self
 
-    def transform(data,proj):
-        if proj is None:
-            raise RuntimeError("Mapper needs to be train before used.")
+    def transform(self, data):
+        """
+        Projects data (with the source's features) to the target space
 
-        d = np.asmatrix(data)
+        Parameters
+        ----------
+        data : Numpy array
+            Array to be projected
+
+        Returns
+        ----------
+        projected : Numpy array
+            The projected array
+
+        """
+        if getattr(self, 'proj_', None) is None:
+            raise RuntimeError("Mapper needs to be train before used.")
 
         # Do projection
-        res = (d * proj).A
+        return np.dot(astype([data], self.dtype)[0], self.proj_)
 
-        return res
+    def fit_transform(self, source, target):
+        """Fits the projection of source to target, and projects source"""
+        return self.fit(source, target).transform(source)
 
-    if format_data:
-        source, target = formatter([source, target])
+def batch_procrustes(sources, target, scaling=True):
+    """
+    Aligns a stack of arrays to the same target at once
 
-    # fit and transform
-    proj = fit(source, target)
-    return transform(source, proj)
+    Gives the same result as calling procrustes (with its default
+    reflection=True, reduction=False and oblique=False) on each source, but
+    runs the cross products and SVDs of all sources as single batched
+    `np.matmul` and `np.linalg.svd` calls.
+
+    Parameters
+    ----------
+    sources : Numpy array, shape (n_sources, n_samples, n_features)
+        The arrays to align
+
+    target : Numpy array, shape (n_samples, n_features)
+        The sources are aligned to this target space
+
+    scaling : bool
+        Estimate a global scaling factor for each transformation
+
+    Returns
+    ----------
+    aligned_sources : Numpy array, shape (n_sources, n_samples, n_features)
+        The sources aligned to target
+
+    """
+    return np.matmul(sources, batch_projections(sources, target, scaling))
+
+def batch_projections(sources, target, scaling=True):
+    """
+    Finds the procrustes projection of each of a stack of arrays to the same
+    target at once
+
+    Source i is aligned to target as np.dot(sources[i], projections[i]).  See
+    batch_procrustes for the parameters.
+
+    Returns
+    ----------
+    projections : Numpy array, shape (n_sources, n_features, n_target_features)
+        The projection of each source
+
+    """
+    dtype = float_dtype(sources, target)
+    n_samples = sources.shape[1]
+
+    # sums of squares (accumulated in double precision)
+    ssqs = np.einsum('ijk,ijk->ik', sources, sources, dtype=np.float64)
+    target_ssq = np.einsum('jk,jk->k', target, target, dtype=np.float64)
+    eps = np.abs((np.finfo(dtype).eps * n_samples)**2)
+    if np.any(np.all(ssqs <= eps, axis=1)) or np.all(target_ssq <= eps):
+        raise ValueError("For now do not handle invariant in time datasets")
+    norms = np.sqrt(ssqs.sum(axis=1))
+    target_norm = np.sqrt(target_ssq.sum())
+
+    # cross products of the normalized target and sources
+    cross = np.matmul(target.T.astype(dtype, copy=False), sources)
+    cross /= (norms * target_norm).astype(dtype)[:, np.newaxis, np.newaxis]
+
+    # optimal rotations
+    U, s, Vh = np.linalg.svd(cross, full_matrices=False)
+    proj = np.matmul(np.swapaxes(Vh, 1, 2), np.swapaxes(U, 1, 2))
+    if scaling:
+        scale = s.sum(axis=1) * target_norm / norms
+        proj *= scale.astype(dtype)[:, np.newaxis, np.newaxis]
+    return proj
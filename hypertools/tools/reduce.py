@@ -1,22 +1,30 @@
 #!/usr/bin/env python
 
 # libraries
+import copy
 import warnings
 import numpy as np
 import six
-from sklearn.decomposition import PCA, FastICA, IncrementalPCA, KernelPCA, FactorAnalysis, TruncatedSVD, SparsePCA, MiniBatchSparsePCA, DictionaryLearning, MiniBatchDictionaryLearning
+import scipy.sparse as sp
+from sklearn.decomposition import PCA, FastICA, IncrementalPCA, KernelPCA, FactorAnalysis, TruncatedSVD, SparsePCA, MiniBatchSparsePCA, DictionaryLearning, MiniBatchDictionaryLearning, NMF, LatentDirichletAllocation
 from sklearn.manifold import TSNE, MDS, SpectralEmbedding, LocallyLinearEmbedding, Isomap
 from umap import UMAP
 from ..tools.df2mat import df2mat
 from .._shared.helpers import *
+from .._shared.cache import persist, digest, named_cache, \
+    UndigestableError
+from .._shared.estimators import RandomizedPCA, LandmarkEmbedding, \
+    StandardizedPCA
+from .._shared import knn
 from .normalize import normalize as normalizer
 from .align import align as aligner
-from .format_data import format_data as formatter
+from .format_data import format_data as formatter, FormattedData
 
 # dictionary of models
 models = {
     'PCA' : PCA,
     'IncrementalPCA' : IncrementalPCA,
+    'RandomizedPCA' : RandomizedPCA,
     'SparsePCA' : SparsePCA,
     'MiniBatchSparsePCA' : MiniBatchSparsePCA,
     'KernelPCA' : KernelPCA,
@@ -30,30 +38,86 @@ models = {
     'SpectralEmbedding' : SpectralEmbedding,
     'LocallyLinearEmbedding' : LocallyLinearEmbedding,
     'MDS' : MDS,
-    'UMAP' : UMAP
+    'UMAP' : UMAP,
+    'NMF' : NMF,
+    'LatentDirichletAllocation' : LatentDirichletAllocation
 }
 
+# models that are fit on scipy.sparse matrices directly.  All other models
+# are given a dense copy of sparse data.
+sparse_models = (TruncatedSVD, NMF, LatentDirichletAllocation)
+
+# models whose leading components do not depend on how many components are
+# kept, so a fit with many components can be reused for requests with fewer
+# components by slicing.  Only exact solvers qualify: incremental and
+# randomized fits change with the number of components.
+nested_models = (PCA, StandardizedPCA)
+exact_svd_solvers = ('full', 'arpack')
+
+# fits of nested models to each dataset, at the largest ndims requested
+nested_fits = named_cache('reduce_nested')
+
+# memory budget (in bytes) for each batch when streaming data through a model
+DEFAULT_BATCH_BYTES = 2**28
+
+# PCA and IncrementalPCA switch to a randomized SVD when the data has at least
+# RANDOMIZED_MIN_SIZE rows or columns, and ndims is at most 1/RANDOMIZED_RATIO
+# of the smaller of the two
+RANDOMIZED_MIN_SIZE = 1000
+RANDOMIZED_RATIO = 10
+
 # main function
 @memoize
+@persist
 def reduce(x, reduce='IncrementalPCA', ndims=None, normalize=None, align=None,
-           model=None, model_params=None, internal=False, format_data=True):
+           model=None, model_params=None, internal=False, format_data=True,
+           return_model=False, batch_bytes=DEFAULT_BATCH_BYTES, dtype=None):
     """
     Reduces dimensionality of an array, or list of arrays
 
     Parameters
     ----------
     x : Numpy array or list of arrays
-        Dimensionality reduction using PCA is performed on this array.
+        Dimensionality reduction using PCA is performed on this array.  To
+        reduce data that does not fit in memory, pass a (list of) np.memmap
+        array(s), or a function that returns a new iterator over chunks of
+        rows each time it is called.  If the model supports incremental
+        fitting (e.g. IncrementalPCA), it is fit with `partial_fit` over
+        batches of rows and the data is transformed in a second pass, so
+        only one batch is held in memory at a time.
 
     reduce : str or dict
         Decomposition/manifold learning model to use.  Models supported: PCA,
-        IncrementalPCA, SparsePCA, MiniBatchSparsePCA, KernelPCA, FastICA,
-        FactorAnalysis, TruncatedSVD, DictionaryLearning, MiniBatchDictionaryLearning,
-        TSNE, Isomap, SpectralEmbedding, LocallyLinearEmbedding, MDS and UMAP.
-        Can be passed as a string, but for finer control of the model
-        parameters, pass as a dictionary, e.g. reduce={'model' : 'PCA',
-        'params' : {'whiten' : True}}. See scikit-learn specific model docs
-        for details on parameters supported for each model.
+        IncrementalPCA, RandomizedPCA, SparsePCA, MiniBatchSparsePCA, KernelPCA,
+        FastICA, FactorAnalysis, TruncatedSVD, DictionaryLearning,
+        MiniBatchDictionaryLearning, TSNE, Isomap, SpectralEmbedding,
+        LocallyLinearEmbedding, MDS, UMAP, NMF and LatentDirichletAllocation.
+        Can be passed as a string, but
+        for finer control of the model parameters, pass as a dictionary, e.g.
+        reduce={'model' : 'PCA', 'params' : {'whiten' : True}}. See
+        scikit-learn specific model docs for details on parameters supported
+        for each model.  To embed many rows with a manifold model (e.g. TSNE,
+        MDS, Isomap or SpectralEmbedding), add a 'landmarks' key to the
+        dictionary, e.g. reduce={'model' : 'MDS', 'params' : None,
+        'landmarks' : 1000}.  The model is then only fit on that many randomly
+        chosen rows, and the other rows are placed by interpolating the
+        embeddings of their nearest landmarks.  'landmarks' may also be a
+        dictionary of LandmarkEmbedding params ('n_landmarks', 'n_neighbors'
+        and 'random_state').  When passed as the string 'PCA' or 'IncrementalPCA'
+        and ndims is much smaller than both the number of samples and features
+        of large data, RandomizedPCA is used instead. Its accuracy can be tuned
+        with the 'n_oversamples' and 'n_iter' params, and the fitted model
+        reports the relative error of the approximation as
+        `approximation_error_` (see return_model).  UMAP, Isomap and
+        SpectralEmbedding are given a nearest neighbors graph that is built
+        once per dataset and shared with other models (and cluster).  PCA with
+        an exact solver (e.g. reduce={'model' : 'PCA', 'params' :
+        {'svd_solver' : 'full'}}) keeps its fit to the data at the largest
+        ndims requested, and answers requests for fewer dimensions by keeping
+        its leading components.  Scipy.sparse data (e.g.
+        the output of text2mat) is kept sparse by TruncatedSVD, NMF and
+        LatentDirichletAllocation, and converted to a dense array for all
+        other models.
 
     ndims : int
         Number of dimensions to reduce
@@ -61,6 +125,22 @@ def reduce(x, reduce='IncrementalPCA', ndims=None, normalize=None, align=None,
     format_data : bool
         Whether or not to first call the format_data function (default: True).
 
+    batch_bytes : int
+        Memory budget (in bytes) for each batch of rows when streaming
+        memory-mapped or chunked data through the model (default: 256MB).
+
+    dtype : numpy dtype or None
+        If set (e.g. np.float32), the data is converted to this type before
+        it is reduced, and the reduced data is returned in this type.
+        PCA-family models then fit float32 data, which halves the memory used
+        (default: None).
+
+    return_model : bool
+        If True, the fitted model is returned along with the reduced data. New
+        data can then be projected into the same space with `model.transform`
+        (or `transform_list` for a list of arrays) instead of refitting
+        (default: False).
+
     model : None
         Deprecated argument.  Please use reduce.
 
@@ -81,6 +161,11 @@ def reduce(x, reduce='IncrementalPCA', ndims=None, normalize=None, align=None,
         The reduced data with ndims dimensionality is returned.  If the input
         is a list, a list is returned.
 
+    model : scikit-learn model or None
+        The fitted model (only returned if return_model=True).  None if no
+        model was fit, e.g. when the data already has ndims or fewer
+        dimensions.
+
     """
 
     # deprecated warning
@@ -93,19 +178,36 @@ def reduce(x, reduce='IncrementalPCA', ndims=None, normalize=None, align=None,
 
     # if model is None, just return data
     if reduce is None:
-        return x
+        return _with_model(x, None, return_model)
     else:
 
+        # stream memory-mapped or chunked data through the model
+        if _is_stream(x):
+            if ndims is not None and normalize is None and align is None and \
+                    (callable(x) or any(i.shape[1]>ndims for i in _as_list(x))):
+                model = _init_model(reduce, ndims)
+                if hasattr(model, 'partial_fit'):
+                    x_reduced = astype(reduce_stream(x, model, batch_bytes),
+                                       dtype)
+                    if internal or len(x_reduced)>1:
+                        return _with_model(x_reduced, model, return_model)
+                    else:
+                        return _with_model(x_reduced[0], model, return_model)
+            if callable(x):
+                x = np.vstack(list(x()))
+
         # common format
         if format_data:
             x = formatter(x, ppca=True)
+        x = astype(x, dtype)
 
-        if np.vstack([i for i in x]).shape[0]==1:
+        n_rows = sum(i.shape[0] for i in x)
+        if n_rows==1:
             warnings.warn('Cannot reduce the dimensionality of a single row of'
                           ' data. Return zeros length of ndims')
-            return [np.zeros((1, ndims))]
+            return _with_model([np.zeros((1, ndims))], None, return_model)
         if ndims:
-            if np.vstack([i for i in x]).shape[0]<ndims:
+            if n_rows<ndims:
                 warnings.warn('The number of rows in your data is less than ndims.'
                               ' The data will be reduced to the number of rows.')
 
@@ -121,49 +223,246 @@ def reduce(x, reduce='IncrementalPCA', ndims=None, normalize=None, align=None,
             x = aligner(x, align=align)
 
         # if the shape of the data is already less than ndims, just return it
+        # (marked as formatted only for internal use)
+        if not internal:
+            x = list(x)
         if ndims is None:
-            return x
+            return _with_model(x, None, return_model)
         elif all([i.shape[1]<=ndims for i in x]):
-            return x
-
-        # if reduce is a string, find the corresponding model
-        if type(reduce) in [str, np.string_]:
-            model = models[reduce]
-            model_params = {
-                'n_components' : ndims
-            }
-        # if its a dict, use custom params
-        elif type(reduce) is dict:
-            if isinstance((reduce['model']), six.string_types):
-                model = models[reduce['model']]
-                if reduce['params'] is None:
-                    model_params = {
-                        'n_components' : ndims
-                    }
-                else:
-                    model_params = reduce['params']
-        if ndims:
-            model_params = {
-                'n_components' : ndims
-            }
+            return _with_model(x, None, return_model)
 
         # initialize model
-        model = model(**model_params)
+        model = _init_model(reduce, ndims)
+        if _use_randomized(reduce, x, ndims):
+            model = RandomizedPCA(n_components=ndims)
 
         # reduce data
-        x_reduced = reduce_list(x, model)
+        if _is_nested(model):
+            x_reduced, model = reduce_nested(x, model, reduce)
+        else:
+            x_reduced = reduce_list(x, model)
+
+        # models (e.g. IncrementalPCA) may return float64 for float32 data
+        x_reduced = astype(x_reduced, dtype)
 
         # return data
-        if internal or len(x_reduced)>1:
-            return x_reduced
+        if internal:
+            return _with_model(FormattedData(x_reduced, missing=False), model,
+                               return_model)
+        elif len(x_reduced)>1:
+            return _with_model(x_reduced, model, return_model)
         else:
-            return x_reduced[0]
+            return _with_model(x_reduced[0], model, return_model)
 
 # sub functions
+def _init_model(reduce, ndims):
+
+    # if reduce is a string, find the corresponding model
+    if type(reduce) in [str, np.string_]:
+        model = models[reduce]
+        model_params = {
+            'n_components' : ndims
+        }
+    # if its a dict, use custom params
+    elif type(reduce) is dict:
+        if isinstance((reduce['model']), six.string_types):
+            model = models[reduce['model']]
+            if reduce.get('params') is None:
+                model_params = {
+                    'n_components' : ndims
+                }
+            else:
+                model_params = dict(reduce['params'])
+    if ndims:
+        model_params['n_components'] = ndims
+    model = model(**model_params)
+
+    # fit on a subsample of landmarks and interpolate the other rows
+    if type(reduce) is dict and reduce.get('landmarks'):
+        landmarks = reduce['landmarks']
+        if isinstance(landmarks, dict):
+            model = LandmarkEmbedding(model, **landmarks)
+        else:
+            model = LandmarkEmbedding(model, n_landmarks=landmarks)
+    return model
+
+def _use_randomized(reduce, x, ndims):
+    if type(reduce) not in [str, np.string_] or \
+            reduce not in ('PCA', 'IncrementalPCA') or \
+            any(sp.issparse(xi) for xi in x):
+        return False
+    n_samples = sum(xi.shape[0] for xi in x)
+    n_features = x[0].shape[1]
+    return max(n_samples, n_features) >= RANDOMIZED_MIN_SIZE and \
+        ndims * RANDOMIZED_RATIO <= min(n_samples, n_features)
+
 def reduce_list(x, model):
-    split = np.cumsum([len(xi) for xi in x])[:-1]
-    x_r = np.vsplit(model.fit_transform(np.vstack(x)), split)
+    split = np.cumsum([xi.shape[0] for xi in x])[:-1]
+    x_r = vsplit(knn.fit_transform(model, _stack(x, model)), split)
     if len(x)>1:
         return [xi for xi in x_r]
     else:
         return [x_r[0]]
+
+def _is_nested(model):
+    if type(model) is PCA:
+        return model.svd_solver in exact_svd_solvers
+    return type(model) in nested_models
+
+def reduce_nested(x, model, reduce):
+    """
+    Reduces a list of arrays with a PCA-family model, reusing an earlier fit
+    to the same data with at least as many components
+
+    Returns the reduced arrays and the fitted (or sliced) model.
+    """
+    ndims = model.n_components
+    try:
+        key = digest(x, _without_ndims(reduce), type(model).__name__)
+    except UndigestableError:
+        return reduce_list(x, model), model
+    if key in nested_fits:
+        x_reduced, fitted = nested_fits[key]
+        if fitted.components_.shape[0] >= ndims:
+            nested_fits.hits += 1
+            return [xi[:, :ndims].copy() for xi in x_reduced], \
+                   _slice_model(fitted, ndims)
+    nested_fits.misses += 1
+    x_reduced = reduce_list(x, model)
+    nested_fits[key] = (x_reduced, model)
+    return x_reduced, model
+
+def _without_ndims(reduce):
+    if type(reduce) is dict and reduce.get('params'):
+        reduce = dict(reduce)
+        reduce['params'] = dict((k, v) for k, v in reduce['params'].items()
+                                if k != 'n_components')
+    return reduce
+
+def _slice_model(model, ndims):
+    """Copies a fitted nested model, keeping its first ndims components"""
+    n_components = model.components_.shape[0]
+    if n_components == ndims:
+        return model
+    sliced = copy.copy(model)
+    sliced.n_components = ndims
+    for attr in ('components_', 'explained_variance_',
+                 'explained_variance_ratio_', 'singular_values_'):
+        if hasattr(model, attr):
+            setattr(sliced, attr, getattr(model, attr)[:ndims])
+    if hasattr(model, 'n_components_'):
+        sliced.n_components_ = ndims
+    if getattr(model, 'noise_variance_', None) is not None and \
+            hasattr(model, 'n_samples_'):
+        # the noise variance is the mean variance of the dropped components
+        rank = min(model.n_samples_, model.components_.shape[1])
+        dropped = model.noise_variance_ * (rank - n_components) + \
+            np.sum(model.explained_variance_[ndims:])
+        sliced.noise_variance_ = dropped / (rank - ndims)
+    return sliced
+
+def transform_list(x, model):
+    """Projects a list of arrays with an already fitted model"""
+    split = np.cumsum([xi.shape[0] for xi in x])[:-1]
+    return vsplit(model.transform(_stack(x, model)), split)
+
+def _stack(x, model):
+    stacked = vstack(x)
+    if sp.issparse(stacked) and not isinstance(model, sparse_models):
+        return stacked.toarray()
+    return stacked
+
+def reduce_stream(x, model, batch_bytes=DEFAULT_BATCH_BYTES):
+    """
+    Fits a model with partial_fit over batches of rows, then transforms the
+    data batch by batch in a second pass
+
+    x is a list of (memory-mapped) arrays, or a function that returns a new
+    iterator over chunks of rows each time it is called.  Returns a list of
+    reduced arrays (one per array, or a single array for chunked data).
+    """
+    min_rows = getattr(model, 'n_components', None) or 1
+
+    if callable(x):
+        chunks = x
+    else:
+        x = _as_list(x)
+        chunks = lambda: (c for xi in x for c in _row_chunks(xi, batch_bytes))
+
+    # first pass: fit
+    for batch in _batches(chunks(), batch_bytes, min_rows):
+        model.partial_fit(batch)
+
+    # second pass: transform
+    if callable(x):
+        return [np.vstack([model.transform(c) for c in x()])]
+    return [np.vstack([model.transform(c) for c in _row_chunks(xi, batch_bytes)])
+            for xi in x]
+
+def _as_list(x):
+    if isinstance(x, list):
+        return x
+    return [x]
+
+def _is_stream(x):
+    if isinstance(x, np.memmap):
+        return True
+    elif isinstance(x, list):
+        return any(isinstance(xi, np.memmap) for xi in x)
+    elif hasattr(x, '__next__') or hasattr(x, 'next'):
+        raise ValueError('Iterators can only be consumed once, but reducing '
+                         'chunked data takes two passes (fit, then transform).'
+                         '  Pass a function that returns a new iterator over '
+                         'the chunks each time it is called instead.')
+    return callable(x)
+
+def _batch_rows(n_features, itemsize, batch_bytes, min_rows=1):
+    return max(min_rows, int(batch_bytes // max(1, n_features * itemsize)))
+
+def _row_chunks(x, batch_bytes):
+    rows = _batch_rows(x.shape[1], x.dtype.itemsize, batch_bytes)
+    for start in range(0, x.shape[0], rows):
+        yield np.asarray(x[start:start+rows])
+
+def _batches(chunks, batch_bytes, min_rows):
+    """
+    Regroups chunks of rows into batches of about batch_bytes, none of
+    which has fewer than min_rows rows
+    """
+    pending = None
+    buf = []
+    n = 0
+    batch_rows = None
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        if batch_rows is None:
+            batch_rows = _batch_rows(chunk.shape[1], chunk.dtype.itemsize,
+                                     batch_bytes, min_rows)
+        buf.append(chunk)
+        n += chunk.shape[0]
+        if n < batch_rows:
+            continue
+        stacked = np.vstack(buf)
+        start = 0
+        while n - start >= batch_rows:
+            if pending is not None:
+                yield pending
+            pending = stacked[start:start+batch_rows]
+            start += batch_rows
+        buf = [stacked[start:]]
+        n -= start
+
+    # fold a remainder that is too small to fit on its own into the last batch
+    rest = np.vstack(buf) if n > 0 else None
+    if rest is not None and n < min_rows and pending is not None:
+        pending = np.vstack([pending, rest])
+        rest = None
+    if pending is not None:
+        yield pending
+    if rest is not None:
+        yield rest
+
+def _with_model(x, model, return_model):
+    if return_model:
+        return x, model
+    return x
@@ -7,7 +7,8 @@ from sklearn.decomposition import LatentDirichletAllocation, NMF
 from sklearn.utils.validation import check_is_fitted
 from sklearn.exceptions import NotFittedError
 from sklearn.pipeline import Pipeline
-from .._shared.helpers import memoize
+from .._shared.helpers import memoize, vsplit
+from .._shared.cache import persist
 from .format_data import format_data
 from .._shared.params import default_params
 from .load import load
@@ -25,6 +26,7 @@ texts = {
 }
 
 @memoize
+@persist
 def text2mat(data, vectorizer='CountVectorizer',
              semantic='LatentDirichletAllocation', corpus='wiki'):
     """
@@ -137,7 +139,7 @@ def text2mat(data, vectorizer='CountVectorizer',
     else:
         tmodel = None
 
-    if type(data) is not list:
+    if not isinstance(data, list):
         data = [data]
 
     if corpus is None:
@@ -149,14 +151,18 @@ def text2mat(data, vectorizer='CountVectorizer',
 
 def _transform(vmodel, tmodel, x):
     split = np.cumsum([len(xi) for xi in x])[:-1]
+
+    # the document-term matrix is kept sparse and passed to the text model as is
     if vmodel is not None:
-        x = np.vsplit(vmodel.transform(np.vstack(x).ravel()).toarray(), split)
+        x = vmodel.transform(np.vstack(x).ravel())
+    else:
+        x = np.vstack(x)
     if tmodel is not None:
         if isinstance(tmodel, Pipeline):
-            x = np.vsplit(tmodel.transform(np.vstack(x).ravel()), split)
+            x = tmodel.transform(x.ravel())
         else:
-            x = np.vsplit(tmodel.transform(np.vstack(x)), split)
-    return [xi for xi in x]
+            x = tmodel.transform(x)
+    return vsplit(x, split)
 
 def _fit_models(vmodel, tmodel, x, model_is_fit):
     if model_is_fit==True:
@@ -36,14 +36,15 @@ setup(
     packages=find_packages(exclude=('images', 'examples', 'tests')),
     install_requires=[
    'PPCA>=0.0.2',
-   'scikit-learn>=0.19.1',
+   'scikit-learn>=0.22',
    'pandas>=0.18.0',
    'seaborn>=0.8.1',
    'matplotlib>=1.5.1',
    'scipy>=1.0.0',
+   'joblib>=0.12',
    'numpy>=1.10.4',
    'hdbscan>=0.8.11',
-   'umap-learn>=0.1.5',
+   'umap-learn>=0.5',
    'future',
    'requests',
    'deepdish',
@@ -43,3 +43,64 @@ def test_align_shapes():
 def test_align_geo():
     aligned = align(geo)
     assert np.allclose(aligned[0], aligned[1])
+
+def test_align_float32():
+    x = [np.random.rand(50, 4).astype(np.float32) for i in range(3)]
+    for method in ['hyper', 'SRM']:
+        aligned = align(x, align=method, dtype=np.float32)
+        assert all(i.dtype==np.float32 for i in aligned)
+        expected = align([i.astype(np.float64) for i in x], align=method)
+        assert np.allclose(aligned, expected, atol=1e-3)
+
+def test_align_n_jobs():
+    x = [np.random.rand(50, 4) for i in range(6)]
+    assert np.array_equal(align(x, align='hyper', n_jobs=2), align(x, align='hyper'))
+
+def test_align_ragged():
+    x = [np.random.rand(50, 4), np.random.rand(60, 2), np.random.rand(50, 4)]
+    aligned = align(x, align='hyper')
+    assert [i.shape for i in aligned]==[(50,4)]*3
+    padded = [np.hstack([i[:50], np.zeros((50, 4 - i.shape[1]))]) for i in x]
+    assert np.allclose(aligned, align(padded, align='hyper'))
+
+def test_align_model():
+    x = [np.random.rand(50, 4) for i in range(3)]
+    aligned, model = align(x, align='hyper', return_model=True)
+    assert np.allclose(model.transform(1, x[1]), aligned[1])
+    new = np.random.rand(50, 4)
+    aligned_new = model.add_subject(new)
+    assert aligned_new.shape==(50,4)
+    assert np.allclose(model.transform(3, new), aligned_new)
+
+def test_align_model_not_shared():
+    x = [np.random.rand(50, 4) for i in range(3)]
+    _, model = align(x, align='hyper', return_model=True)
+    model.add_subject(np.random.rand(50, 4))
+    _, fresh = align(x, align='hyper', return_model=True)
+    assert fresh is not model
+    assert len(fresh.projections)==3
+
+def test_align_model_SRM():
+    x = [np.random.rand(50, 4) for i in range(3)]
+    aligned, model = align(x, align='SRM', return_model=True)
+    assert np.allclose(model.transform(0, x[0]), aligned[0])
+
+def test_align_SRM_params():
+    x = [np.random.rand(50, 4) for i in range(3)]
+    aligned = align(x, align={'model': 'SRM', 'params': {'n_iter': 50, 'tol': 1e-4}})
+    assert [i.shape for i in aligned]==[(50,4)]*3
+    assert np.allclose(align(x, align='SRM', n_jobs=2), align(x, align='SRM'))
+    aligned = align(x, align={'model': 'SRM', 'params': None})
+    assert [i.shape for i in aligned]==[(50,4)]*3
+
+def test_align_SRM_sketch():
+    x = [np.random.rand(50, 4) for i in range(3)]
+    aligned, model = align(x, align={'model': 'SRM', 'params': {'init': 'sketch'}},
+                           return_model=True)
+    assert [i.shape for i in aligned]==[(50,4)]*3
+    assert np.allclose(np.dot(model.projections[0].T, model.projections[0]), np.eye(4))
+
+def test_align_SRM_chunks():
+    x = [np.random.rand(50, 4) for i in range(3)]
+    chunked = align(x, align={'model': 'SRM', 'params': {'chunk_size': 16}})
+    assert np.allclose(chunked, align(x, align='SRM'))
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import numpy as np
+import scipy.sparse as sp
+
+from hypertools._shared.cache import digest, memoize, persist, LRUCache, \
+    DiskCache, set_disk_cache, clear_disk_cache, cache_stats, clear_cache
+
+def test_digest_same_contents():
+    a = np.random.rand(100, 10)
+    assert digest(a) == digest(a.copy())
+
+def test_digest_large_arrays_differ():
+    # large arrays share a truncated repr, but not a digest
+    a = np.zeros((2000, 10))
+    b = a.copy()
+    b[1000, 5] = 1
+    assert str(a) == str(b)
+    assert digest(a) != digest(b)
+
+def test_digest_shape_and_dtype():
+    a = np.zeros(12)
+    assert digest(a) != digest(a.reshape(3, 4))
+    assert digest(a) != digest(a.astype(np.float32))
+
+def test_digest_sparse():
+    a = sp.random(100, 10, density=.1, format='csr', random_state=0)
+    b = a.copy()
+    assert digest(a) == digest(b)
+    b[0, 0] = b[0, 0] + 1
+    assert digest(a) != digest(b)
+
+def test_lru_eviction():
+    cache = LRUCache(maxbytes=3 * 800)
+    for i in range(4):
+        cache[i] = np.zeros(100)
+    assert len(cache) == 3
+    assert 0 not in cache
+    assert cache.nbytes == 3 * 800
+
+def test_lru_recently_used_kept():
+    cache = LRUCache(maxbytes=2 * 800)
+    cache['a'] = np.zeros(100)
+    cache['b'] = np.zeros(100)
+    cache['a']
+    cache['c'] = np.zeros(100)
+    assert 'a' in cache and 'b' not in cache
+
+def test_memoize():
+    calls = []
+
+    @memoize
+    def f(x, scale=1):
+        calls.append(1)
+        return x * scale
+
+    x = np.random.rand(10, 3)
+    f(x)
+    f(x.copy())
+    assert len(calls) == 1
+    f(x, scale=2)
+    assert len(calls) == 2
+    assert len(f.cache) == 2
+
+def test_disk_cache_roundtrip(tmpdir):
+    cache = DiskCache(str(tmpdir))
+    data = [np.random.rand(10, 3), np.random.rand(5, 3)]
+    cache.set('f', 'key', data)
+    result = cache.get('f', 'key')
+    assert isinstance(result, list)
+    assert all(np.array_equal(a, b) for a, b in zip(data, result))
+    assert cache.get('f', 'other') is None
+
+def test_disk_cache_eviction(tmpdir):
+    cache = DiskCache(str(tmpdir), maxbytes=12000)
+    cache.set('f', 'a', np.zeros(1000))
+    cache.set('f', 'b', np.zeros(1000))
+    assert cache.get('f', 'a') is None
+    assert cache.get('f', 'b') is not None
+
+def test_persist(tmpdir):
+    calls = []
+
+    @persist
+    def f(x, scale=1):
+        calls.append(1)
+        return x * scale
+
+    x = np.random.rand(10, 3)
+    set_disk_cache(str(tmpdir))
+    try:
+        f(x)
+        result = f(x, scale=1)
+        assert len(calls) == 1
+        assert np.allclose(result, x)
+        f.invalidate(x)
+        f(x)
+        assert len(calls) == 2
+        clear_disk_cache(f)
+        f(x)
+        assert len(calls) == 3
+    finally:
+        set_disk_cache(None)
+
+def test_cache_stats():
+    @memoize(maxbytes=800)
+    def g(x):
+        return x * 2
+
+    x = np.zeros(100)
+    g(x)
+    g(x)
+    g(x + 1)
+    stats = cache_stats()['g']
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 1
+    assert stats['nbytes'] == 800
+    clear_cache(g)
+    assert cache_stats()['g']['entries'] == 0
+    assert cache_stats()['g']['hits'] == 0
+
+def test_disk_cache_keeps_container(tmpdir):
+    from hypertools.tools.format_data import FormattedData
+    cache = DiskCache(str(tmpdir))
+    data = FormattedData([np.random.rand(10, 3)], missing=False)
+    cache.set('f', 'key', data)
+    result = cache.get('f', 'key')
+    assert isinstance(result, FormattedData)
+    assert result.missing is False
+    assert not any(isinstance(i, np.memmap) for i in result)
+    assert np.array_equal(result[0], data[0])
+
+def test_memoize_skips_undigestable():
+    calls = []
+
+    @memoize
+    def f(x):
+        calls.append(1)
+        return x()
+
+    f(lambda: 1)
+    f(lambda: 2)
+    assert len(calls) == 2
+    assert len(f.cache) == 0
+
+def test_disk_cache_model(tmpdir):
+    from sklearn.decomposition import PCA
+    cache = DiskCache(str(tmpdir))
+    x = np.random.rand(20, 4)
+    model = PCA(n_components=2).fit(x)
+    cache.set('f', 'key', (model.transform(x), model))
+    result, cached = cache.get('f', 'key')
+    assert np.allclose(result, model.transform(x))
+    assert np.allclose(cached.components_, model.components_)
+
+def test_persist_analyze_models(tmpdir):
+    from hypertools.tools.analyze import analyze
+    x = [np.random.rand(50, 6) for i in range(2)]
+    set_disk_cache(str(tmpdir))
+    try:
+        aligned, models = analyze(x, reduce='IncrementalPCA', ndims=2,
+                                  align='hyper', return_model=True)
+        stored = set(p.basename for p in tmpdir.listdir())
+        assert set(['analyze', 'reduce', 'align']) <= stored
+        clear_cache()
+        cached, cached_models = analyze(x, reduce='IncrementalPCA', ndims=2,
+                                        align='hyper', return_model=True)
+        assert np.allclose(cached, aligned)
+        assert np.allclose(cached_models['reduce'].components_,
+                           models['reduce'].components_)
+    finally:
+        set_disk_cache(None)
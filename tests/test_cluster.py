@@ -27,3 +27,17 @@ def text_cluster_geo():
     geo = plot(data, show=False)
     hdbscan_labels = cluster(geo, cluster='HDBSCAN')
     assert len(set(hdbscan_labels)) == 2
+
+def test_cluster_spectral_shares_graph():
+    from sklearn.cluster import SpectralClustering
+    from hypertools._shared.cache import cache_stats
+    params = {'n_clusters' : 2, 'affinity' : 'nearest_neighbors',
+              'n_neighbors' : 10, 'random_state' : 0}
+    spectral_labels = cluster(data, cluster={'model' : 'SpectralClustering',
+                                             'params' : params})
+    expected = SpectralClustering(**params).fit(data).labels_
+    assert np.array_equal(spectral_labels, expected)
+    hits = cache_stats()['knn_graph']['hits']
+    params['n_neighbors'] = 5
+    cluster(data, cluster={'model' : 'SpectralClustering', 'params' : params})
+    assert cache_stats()['knn_graph']['hits']==hits+1
@@ -3,8 +3,10 @@
 import pytest
 import numpy as np
 import pandas as pd
+import scipy.sparse
 
 from hypertools.tools import format_data
+from hypertools.tools.format_data import fill_missing
 from hypertools.plot.plot import plot
 
 def test_np_array():
@@ -17,6 +19,10 @@ def test_df():
     assert isinstance(format_data(data), list)
     assert isinstance(format_data(data)[0], np.ndarray)
 
+def test_sparse():
+    data = scipy.sparse.random(100, 10, density=.1, format='csr')
+    assert scipy.sparse.issparse(format_data(data)[0])
+
 def test_text():
     data = ['here is some test text', 'and a little more', 'and more']
     assert isinstance(format_data(data), list)
@@ -56,3 +62,77 @@ def test_force_align():
     assert isinstance(res, list)
     assert all(map(lambda x: isinstance(x, np.ndarray), res))
     assert all(map(lambda x: x.shape[1]==100, res))
+
+def test_format_data_formatted():
+    res = format_data([np.random.rand(20, 3) for i in range(2)])
+    assert format_data(res) is res
+    missing = np.random.rand(20, 3)
+    missing[4, 1] = np.nan
+    res = format_data(missing, ppca=False)
+    assert np.isnan(res[0]).any()
+    assert not np.isnan(format_data(res)[0]).any()
+
+def test_fill_missing():
+    x = [np.random.rand(20, 3) for i in range(2)]
+    assert all(a is b for a, b in zip(fill_missing(x), x))
+    x[1][5] = np.nan
+    with pytest.warns(UserWarning):
+        filled = fill_missing(x)
+    assert [i.shape for i in filled]==[(20, 3)]*2
+    assert not np.isnan(np.vstack(filled)).any()
+
+def test_ppca_subsample():
+    from hypertools._externals.ppca import PPCA
+    rng = np.random.RandomState(0)
+    full = np.dot(rng.randn(1000, 2), rng.randn(2, 6)) + .1 * rng.randn(1000, 6)
+    data = full.copy()
+    missing = rng.rand(*data.shape) < .2
+    data[missing] = np.nan
+    m = PPCA()
+    m.fit(data.copy(), d=2, n_fit=100, chunk_size=150, random_state=0)
+    assert m.data.shape==(1000, 6)
+
+    # missing values are the conditional means given the observed values
+    std = (data - m.means) / m.stds
+    for i in np.flatnonzero(missing.any(axis=1))[:20]:
+        o, w = ~missing[i], m.W
+        z = np.linalg.solve(np.dot(w[o].T, w[o]) + m.ss * np.eye(2),
+                            np.dot(w[o].T, std[i, o]))
+        assert np.allclose(m.data[i, ~o], np.dot(w[~o], z))
+
+    # the rows left out of the fit are imputed about as well as by a fit to
+    # all of the rows
+    imputed = m.data * m.stds + m.means
+    error = np.sqrt(np.mean((imputed - full)[missing]**2))
+    m_all = PPCA()
+    m_all.fit(data.copy(), d=2, random_state=0)
+    imputed = m_all.data * m_all.stds + m_all.means
+    assert error < 1.1 * np.sqrt(np.mean((imputed - full)[missing]**2))
+
+def test_format_data_reuse_ppca():
+    rng = np.random.RandomState(0)
+    data = rng.rand(100, 4)
+    data[3, 1] = np.nan
+    res, model = format_data(data, return_model=True)
+    assert np.allclose(format_data(data)[0], res[0])
+    new = rng.rand(20, 4)
+    new[0, 2] = np.nan
+    res_new = format_data(new, ppca=model)
+    assert res_new[0].shape==(20, 4)
+    assert not np.isnan(res_new[0]).any()
+    assert np.allclose(format_data(data, ppca=model)[0], res[0], atol=1e-5)
+
+def test_ppca_imputation_error():
+    # with d equal to the number of columns, the initial noise variance is
+    # ~0; EM used to stop there, imputing with errors of ~2.2 instead of the
+    # ~0.12 of the original implementation
+    for seed in range(6):
+        rng = np.random.RandomState(seed)
+        full = np.dot(rng.randn(2000, 5), rng.randn(5, 40)) + \
+            .1 * rng.randn(2000, 40)
+        data = full.copy()
+        missing = rng.rand(*data.shape) < .1
+        data[missing] = np.nan
+        res, model = format_data(data, ppca=True, return_model=True)
+        imputed = model.data * model.stds + model.means
+        assert np.sqrt(np.mean((imputed - full)[missing]**2)) < .15
@@ -45,6 +45,10 @@ def test_geo_transform():
 def test_geo_transform_dims():
     assert geo.transform(data)[0].shape[1]==3
 
+def test_geo_transform_uses_fitted_model():
+    assert geo.reduce_model is not None
+    assert np.allclose(geo.transform(data)[0], geo.xform_data[0])
+
 def test_geo_plot():
     assert isinstance(geo.plot(show=False), DataGeometry)
 
@@ -31,3 +31,25 @@ def test_normalize_geo():
     geo = plot(data, show=False)
     norm_data = normalize(geo, normalize='row')
     assert np.allclose(np.mean(np.vstack(norm_data), axis=1),0)
+
+def test_normalize_float32():
+    x = [np.random.rand(50, 4) for i in range(2)]
+    result = normalize(x, normalize='across', dtype=np.float32)
+    assert all(i.dtype==np.float32 for i in result)
+    assert np.allclose(result, normalize(x, normalize='across'), atol=1e-5)
+
+def test_normalize_chunks_inplace():
+    x = [np.random.rand(50, 4) for i in range(2)]
+    expected = normalize(x, normalize='across')
+    copies = [i.copy() for i in x]
+    result = normalize(copies, normalize='across', chunk_size=7, inplace=True)
+    assert result[0] is copies[0]
+    assert np.allclose(result, expected)
+
+def test_normalize_inplace_not_memoized():
+    x = np.random.rand(50, 4)
+    a, b = x.copy(), x.copy()
+    normalize(a, normalize='within', inplace=True)
+    normalize(b, normalize='within', inplace=True)
+    assert np.allclose(a, normalize(x, normalize='within'))
+    assert np.allclose(b, a)
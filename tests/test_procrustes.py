@@ -5,7 +5,7 @@ import pytest
 import scipy.io as sio
 import numpy as np
 
-from hypertools.tools.procrustes import procrustes
+from hypertools.tools.procrustes import procrustes, batch_procrustes, Procrustes
 from hypertools.tools.load import load
 
 def test_procrustes_func():
@@ -16,3 +16,23 @@ def test_procrustes_func():
     source = np.dot(target, rot)
     source_aligned = procrustes(source,target)
     assert np.allclose(target,source_aligned)
+
+def test_batch_procrustes():
+    sources = np.random.randn(5, 30, 4)
+    target = np.random.randn(30, 4)
+    expected = [procrustes(source, target) for source in sources]
+    assert np.allclose(batch_procrustes(sources, target), expected)
+
+def test_procrustes_fewer_features():
+    source = np.random.randn(30, 2)
+    target = np.random.randn(30, 4)
+    padded = np.hstack([source, np.zeros((30, 2))])
+    assert np.allclose(procrustes(source, target), procrustes(padded, target))
+
+def test_procrustes_class():
+    source = np.random.randn(30, 3)
+    target = np.random.randn(30, 3)
+    mapper = Procrustes().fit(source, target)
+    assert np.allclose(mapper.transform(source), procrustes(source, target))
+    session = np.random.randn(10, 3)
+    assert np.allclose(mapper.transform(session), np.dot(session, mapper.proj_))
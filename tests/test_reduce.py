@@ -7,7 +7,11 @@ import numpy as np
 import scipy
 
 from hypertools.tools.reduce import reduce as reducer
+from hypertools.tools.analyze import analyze
+from hypertools.tools.normalize import normalize
 from hypertools.plot.plot import plot
+from hypertools._shared.cache import cache_stats
+from sklearn.decomposition import PCA
 
 data = [np.random.multivariate_normal(np.zeros(4), np.eye(4), size=10) for i in range(2)]
 reduced_data_2d = reducer(data,ndims=2)
@@ -101,3 +105,146 @@ def test_reduce_MDS():
 def test_reduce_UMAP():
     reduced_data_3d = reducer(data, reduce='UMAP', ndims=3)
     assert reduced_data_3d[0].shape==(10,3)
+
+def test_reduce_return_model():
+    reduced_data_2d, model = reducer(data, reduce='PCA', ndims=2, return_model=True)
+    assert np.allclose(model.transform(data[0]), reduced_data_2d[0])
+
+def test_reduce_memmap(tmpdir):
+    fname = str(tmpdir.join('data.npy'))
+    np.save(fname, np.vstack(data))
+    mm = np.load(fname, mmap_mode='r')
+    reduced = reducer(mm, ndims=2, batch_bytes=4*8*5)
+    assert reduced.shape==(20,2)
+    reduced = reducer([mm[:10], mm[10:]], ndims=2, batch_bytes=4*8*5)
+    assert [i.shape for i in reduced]==[(10,2), (10,2)]
+
+def test_reduce_chunks():
+    x = np.random.randn(100, 4) * [4, 3, 2, 1]
+    chunks = lambda: (x[i:i+7] for i in range(0, 100, 7))
+    reduced = reducer(chunks, ndims=2)
+    expected = reducer(x, reduce='PCA', ndims=2)
+    assert np.allclose(np.abs(reduced), np.abs(expected), atol=1e-2)
+
+def test_reduce_iterator():
+    with pytest.raises(ValueError):
+        reducer(iter(data), ndims=2)
+
+def test_reduce_RandomizedPCA():
+    reduced_data_3d = reducer(data, reduce='RandomizedPCA', ndims=3)
+    assert reduced_data_3d[0].shape==(10,3)
+
+def test_reduce_RandomizedPCA_params():
+    x = np.random.randn(200, 50) * np.logspace(2, -2, 50)
+    reduced, model = reducer(x, reduce={'model' : 'RandomizedPCA',
+                                        'params' : {'n_iter' : 7}},
+                             ndims=3, return_model=True)
+    assert model.n_iter==7
+    assert np.allclose(np.abs(reduced), np.abs(reducer(x, reduce='PCA', ndims=3)))
+
+def test_reduce_wide_data_uses_randomized():
+    x = np.random.randn(100, 2000)
+    reduced, model = reducer(x, reduce='PCA', ndims=3, return_model=True)
+    assert reduced.shape==(100,3)
+    assert 0 < model.approximation_error_ < 1
+
+def test_reduce_sparse_TruncatedSVD():
+    x = scipy.sparse.random(100, 50, density=.1, format='csr', random_state=0)
+    reduced, model = reducer([x[:60], x[60:]], reduce='TruncatedSVD', ndims=3,
+                             return_model=True)
+    assert [i.shape for i in reduced]==[(60,3), (40,3)]
+    assert np.allclose(np.vstack(reduced), model.transform(x))
+
+def test_reduce_sparse_PCA():
+    x = scipy.sparse.random(100, 50, density=.1, format='csr', random_state=0)
+    reduced = reducer(x, reduce='PCA', ndims=3)
+    assert np.allclose(np.abs(reduced), np.abs(reducer(x.toarray(), reduce='PCA', ndims=3)))
+
+def test_reduce_landmarks():
+    x = np.random.randn(300, 5)
+    reduced, model = reducer(x, reduce={'model' : 'MDS', 'params' : None,
+                                        'landmarks' : 50},
+                             ndims=2, return_model=True)
+    assert reduced.shape==(300,2)
+    assert model.landmarks_.shape==(50,5)
+    # landmarks keep their own embedding
+    assert np.allclose(model.transform(model.landmarks_), model.embedding_)
+
+def test_reduce_landmarks_params():
+    x = np.random.randn(300, 5)
+    reduced, model = reducer(x, reduce={'model' : 'SpectralEmbedding',
+                                        'landmarks' : {'n_landmarks' : 100,
+                                                       'n_neighbors' : 5}},
+                             ndims=2, return_model=True)
+    assert reduced.shape==(300,2)
+    assert model.nn_.n_neighbors==5
+
+def test_reduce_nested_ndims():
+    x = np.random.randn(100, 10) * np.arange(10, 0, -1)
+    exact = {'model' : 'PCA', 'params' : {'svd_solver' : 'full'}}
+    reduced_5d = reducer(x, reduce=exact, ndims=5)
+    hits = cache_stats()['reduce_nested']['hits']
+    reduced_2d, model = reducer(x, reduce=exact, ndims=2, return_model=True)
+    assert cache_stats()['reduce_nested']['hits']==hits+1
+    assert np.allclose(reduced_2d, reduced_5d[:, :2])
+    fresh = PCA(n_components=2).fit(x)
+    assert np.allclose(np.abs(reduced_2d), np.abs(fresh.transform(x)))
+    assert np.isclose(model.noise_variance_, fresh.noise_variance_)
+    assert model.components_.shape==(2,10)
+    assert np.allclose(model.transform(x), reduced_2d)
+
+def test_reduce_inexact_not_nested():
+    # IncrementalPCA fits change with ndims, so they are never sliced
+    x = np.random.randn(500, 20) * np.arange(20, 0, -1)
+    fresh = reducer(x, ndims=3)
+    reducer.cache.clear()
+    reducer(x, ndims=10)
+    assert np.allclose(reducer(x, ndims=3), fresh)
+
+def test_reduce_Isomap_shared_graph():
+    from sklearn.manifold import Isomap
+    x = np.random.randn(200, 5)
+    reduced, model = reducer(x, reduce='Isomap', ndims=2, return_model=True)
+    assert np.allclose(np.abs(reduced), np.abs(Isomap(n_components=2).fit_transform(x)))
+    assert np.allclose(model.transform(x[:10]), reduced[:10])
+
+def test_analyze_fused_normalize_PCA():
+    x = [np.random.rand(50, 6) for i in range(2)]
+    fused, models = analyze(x, normalize='across', reduce='PCA', ndims=2,
+                            return_model=True)
+    expected = reducer(normalize(x, normalize='across'), reduce='PCA', ndims=2)
+    assert np.allclose(np.abs(fused), np.abs(expected))
+    assert np.allclose(models['reduce'].transform(normalize(x, normalize='across')[0]),
+                       fused[0])
+
+def test_analyze_fused_constant_within():
+    # a column constant within one array is zeroed there by normalize, so
+    # analyze falls back to normalizing and reducing separately
+    x = [np.random.rand(50, 6) for i in range(2)]
+    x[1][:, 2] = 3.
+    fused, models = analyze(x, normalize='across', reduce='PCA', ndims=2,
+                            return_model=True)
+    expected = reducer(normalize(x, normalize='across'), reduce='PCA', ndims=2)
+    assert np.allclose(np.abs(fused), np.abs(expected))
+    assert isinstance(models['reduce'], PCA)
+
+def test_reduce_chunks_not_memoized():
+    # functions are not keyed by their (reusable) address, so two streams
+    # reduced one after the other never share a cached result
+    a = np.random.randn(100, 4) * [4, 3, 2, 1]
+    b = np.random.randn(100, 4) * [1, 2, 3, 4]
+    reduced_a = reducer(lambda: (a[i:i+10] for i in range(0, 100, 10)), ndims=2)
+    reduced_b = reducer(lambda: (b[i:i+10] for i in range(0, 100, 10)), ndims=2)
+    assert not np.allclose(np.abs(reduced_a), np.abs(reduced_b))
+    assert np.allclose(np.abs(reduced_b), np.abs(reducer(b, reduce='PCA', ndims=2)), atol=1e-2)
+
+def test_reduce_float32():
+    x = [np.random.rand(50, 6) for i in range(2)]
+    assert all(i.dtype==np.float32 for i in reducer(x, ndims=2, dtype=np.float32))
+    assert all(i.dtype==np.float32 for i in
+               analyze(x, reduce='IncrementalPCA', ndims=2, dtype=np.float32))
+    assert all(i.dtype==np.float32 for i in
+               analyze(x, reduce='IncrementalPCA', ndims=2, normalize='across',
+                       dtype=np.float32))
+    geo = plot(x, ndims=2, dtype=np.float32, show=False)
+    assert all(i.dtype==np.float32 for i in geo.xform_data)